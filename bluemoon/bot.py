@@ -9,6 +9,7 @@ from discord.ext import commands
 
 from .config import Settings
 from .db import Database
+from .http import HttpClient
 from . import cogs as cogs_pkg
 
 
@@ -28,10 +29,18 @@ class BlueMoonBot(commands.Bot):
             activity=discord.Activity(type=discord.ActivityType.watching, name="the blue moon"),
         )
         self.settings = settings
-        self.db = Database(settings.database_path)
+        self.db = Database(
+            settings.database_path,
+            write_batch_ms=settings.db_write_batch_ms,
+            write_batch_size=settings.db_write_batch_size,
+            reader_count=settings.db_readers,
+            reader_queue_depth=settings.db_reader_queue_depth,
+        )
+        self.http_client = HttpClient()
 
     async def setup_hook(self) -> None:
         await self.db.connect()
+        await self.http_client.start()
 
         for module in pkgutil.iter_modules(cogs_pkg.__path__):
             if module.name.startswith("_"):
@@ -46,8 +55,9 @@ class BlueMoonBot(commands.Bot):
             await self.tree.sync()
 
     async def close(self) -> None:
-        await self.db.close()
         await super().close()
+        await self.http_client.close()
+        await self.db.close()
 
     async def on_ready(self) -> None:
         print(f"Logged in as {self.user} ({self.user.id if self.user else 'n/a'})")
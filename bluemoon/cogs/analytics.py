@@ -6,30 +6,34 @@ from datetime import datetime, timedelta, timezone
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 
 class AnalyticsCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        self.retention_compactor.start()
+
+    def cog_unload(self) -> None:
+        self.retention_compactor.cancel()
 
     analytics = app_commands.Group(name="analytics", description="Logging and analytics")
 
     @analytics.command(name="growth", description="Server join/leave trend for last 14 days")
     async def growth(self, interaction: discord.Interaction) -> None:
-        since = int((discord.utils.utcnow() - timedelta(days=14)).timestamp())
+        since = int((discord.utils.utcnow() - timedelta(days=13)).timestamp())
         rows = await self.bot.db.fetchall(
-            "SELECT event_type, created_at FROM analytics_events WHERE guild_id = ? AND created_at >= ? AND event_type IN ('member_join','member_leave')",
-            (interaction.guild_id, since),
+            "SELECT event_type, bucket, count FROM analytics_daily WHERE guild_id = ? AND event_type IN ('member_join','member_leave') AND bucket >= ?",
+            (interaction.guild_id, since - since % 86400),
         )
         joined = Counter()
         left = Counter()
         for row in rows:
-            day = datetime.fromtimestamp(row["created_at"], tz=timezone.utc).strftime("%Y-%m-%d")
+            day = datetime.fromtimestamp(row["bucket"], tz=timezone.utc).strftime("%Y-%m-%d")
             if row["event_type"] == "member_join":
-                joined[day] += 1
+                joined[day] += row["count"]
             else:
-                left[day] += 1
+                left[day] += row["count"]
         days = [(discord.utils.utcnow() - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(13, -1, -1)]
         lines = ["Date | Joins | Leaves"]
         for d in days:
@@ -40,13 +44,12 @@ class AnalyticsCog(commands.Cog):
     async def heatmap(self, interaction: discord.Interaction) -> None:
         since = int((discord.utils.utcnow() - timedelta(days=7)).timestamp())
         rows = await self.bot.db.fetchall(
-            "SELECT created_at FROM analytics_events WHERE guild_id = ? AND created_at >= ? AND event_type = 'message_create'",
-            (interaction.guild_id, since),
+            "SELECT bucket, count FROM analytics_hourly WHERE guild_id = ? AND event_type = 'message_create' AND bucket >= ?",
+            (interaction.guild_id, since - since % 3600),
         )
         bins = Counter()
         for row in rows:
-            hour = datetime.fromtimestamp(row["created_at"], tz=timezone.utc).hour
-            bins[hour] += 1
+            bins[(row["bucket"] // 3600) % 24] += row["count"]
         max_val = max(bins.values(), default=1)
         lines = ["Hour | Activity"]
         for hour in range(24):
@@ -92,6 +95,26 @@ class AnalyticsCog(commands.Cog):
             lines.append(f"{ts} by {actor}: {payload}")
         await interaction.response.send_message("\n".join(lines)[:1900])
 
+    @tasks.loop(hours=1)
+    async def retention_compactor(self) -> None:
+        await self.bot.wait_until_ready()
+        try:
+            deleted = await self.bot.db.compact_analytics(
+                self.bot.settings.analytics_retention,
+                archive_dir=self.bot.settings.analytics_archive_dir,
+            )
+        except Exception as exc:
+            print(f"Analytics compaction failed: {exc}")
+        else:
+            if deleted:
+                print(f"Analytics compaction removed {deleted} expired events")
+        music = self.bot.get_cog("MusicCog")
+        if music:
+            try:
+                await music.prune_lyrics()
+            except Exception as exc:
+                print(f"Lyrics cache pruning failed: {exc}")
+
 
 async def setup(bot: commands.Bot) -> None:
     cog = AnalyticsCog(bot)
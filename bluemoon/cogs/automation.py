@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
@@ -103,9 +102,8 @@ class AutomationCog(commands.Cog):
         if not interaction.user.guild_permissions.manage_webhooks:
             await interaction.response.send_message("Manage Webhooks required.", ephemeral=True)
             return
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json={"content": content[:1500]}, timeout=20) as resp:
-                status = resp.status
+        async with self.bot.http_client.post(webhook_url, json={"content": content[:1500]}) as resp:
+            status = resp.status
         await interaction.response.send_message(f"Webhook dispatched (status={status}).")
 
 
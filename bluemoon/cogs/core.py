@@ -6,27 +6,150 @@ import random
 import re
 import time
 from collections import defaultdict, deque
+from dataclasses import dataclass
 from datetime import timedelta
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from bluemoon.db import now_ts
+from bluemoon.db import Database, GuildSettings, now_ts
+from bluemoon.utils.automod import CompiledFilter
 from bluemoon.utils.constants import PROFANITY_WORDS
 from bluemoon.utils.helpers import clean_caps_ratio, level_from_xp, xp_for_level
 
 
+@dataclass
+class XpEntry:
+    xp: int
+    level: int
+    pending_xp: int = 0
+    pending_voice: int = 0
+    touched_at: int = 0
+
+
+class XpAccumulator:
+    def __init__(self, db: Database, idle_seconds: int = 3600) -> None:
+        self.db = db
+        self.idle_seconds = idle_seconds
+        self.entries: dict[tuple[int, int], XpEntry] = {}
+        self.dirty: set[tuple[int, int]] = set()
+
+    async def add(self, guild_id: int, user_id: int, xp: int, voice_seconds: int = 0) -> tuple[int, int]:
+        key = (guild_id, user_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            row = await self.db.get_user_row(guild_id, user_id)
+            entry = self.entries.setdefault(key, XpEntry(xp=row["xp"], level=row["level"]))
+        old_level = entry.level
+        entry.xp += xp
+        entry.pending_xp += xp
+        entry.pending_voice += voice_seconds
+        entry.level = max(entry.level, level_from_xp(entry.xp))
+        entry.touched_at = now_ts()
+        self.dirty.add(key)
+        return old_level, entry.level
+
+    async def flush(self) -> None:
+        if not self.dirty:
+            self._evict_idle()
+            return
+        keys, self.dirty = self.dirty, set()
+        batch: list[tuple[tuple[int, int], int, int]] = []
+        params: list[tuple[int, int, int, int, int]] = []
+        for key in keys:
+            entry = self.entries.get(key)
+            if entry is None:
+                continue
+            batch.append((key, entry.pending_xp, entry.pending_voice))
+            params.append((key[0], key[1], entry.pending_xp, entry.level, entry.pending_voice))
+            entry.pending_xp = 0
+            entry.pending_voice = 0
+        try:
+            await self.db.executemany(
+                """
+                INSERT INTO user_state (guild_id, user_id, xp, level, voice_seconds)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                    xp = xp + excluded.xp,
+                    level = max(level, excluded.level),
+                    voice_seconds = voice_seconds + excluded.voice_seconds
+                """,
+                params,
+            )
+        except Exception:
+            for key, pending_xp, pending_voice in batch:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.pending_xp += pending_xp
+                    entry.pending_voice += pending_voice
+                    self.dirty.add(key)
+            raise
+        self._evict_idle()
+
+    def _evict_idle(self) -> None:
+        cutoff = now_ts() - self.idle_seconds
+        stale = [k for k, e in self.entries.items() if k not in self.dirty and e.touched_at < cutoff]
+        for key in stale:
+            del self.entries[key]
+
+
 class CoreCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.spam_tracker: dict[int, dict[int, deque[int]]] = defaultdict(lambda: defaultdict(deque))
         self.join_tracker: dict[int, deque[int]] = defaultdict(deque)
         self.voice_join_ts: dict[tuple[int, int], int] = {}
+        self.xp = XpAccumulator(bot.db)
+        self.level_roles: dict[int, dict[int, int]] = {}
+        self.level_role_generation: dict[int, int] = {}
+        self.filters: dict[int, CompiledFilter] = {}
+        self.filter_generation: dict[int, int] = {}
+        self.xp_flusher.start()
 
     async def cog_load(self) -> None:
         print("CoreCog loaded")
 
+    async def cog_unload(self) -> None:
+        self.xp_flusher.cancel()
+        await self.xp.flush()
+
+    @tasks.loop(seconds=30)
+    async def xp_flusher(self) -> None:
+        try:
+            await self.xp.flush()
+        except Exception as exc:
+            print(f"XP flush failed: {exc}")
+
+    async def _level_role_id(self, guild_id: int, level: int) -> int | None:
+        roles = self.level_roles.get(guild_id)
+        if roles is None:
+            generation = self.level_role_generation.get(guild_id, 0)
+            rows = await self.bot.db.fetchall("SELECT level, role_id FROM level_roles WHERE guild_id = ?", (guild_id,))
+            roles = {r["level"]: r["role_id"] for r in rows}
+            if self.level_role_generation.get(guild_id, 0) == generation:
+                roles = self.level_roles.setdefault(guild_id, roles)
+        return roles.get(level)
+
+    def invalidate_level_roles(self, guild_id: int) -> None:
+        self.level_role_generation[guild_id] = self.level_role_generation.get(guild_id, 0) + 1
+        self.level_roles.pop(guild_id, None)
+
+    async def _filter(self, guild_id: int) -> CompiledFilter:
+        compiled = self.filters.get(guild_id)
+        if compiled is None:
+            generation = self.filter_generation.get(guild_id, 0)
+            bad_words = PROFANITY_WORDS | await self.bot.db.get_bad_words(guild_id)
+            patterns = await self.bot.db.get_regex_filters(guild_id)
+            compiled = CompiledFilter(bad_words, patterns)
+            if self.filter_generation.get(guild_id, 0) == generation:
+                compiled = self.filters.setdefault(guild_id, compiled)
+        return compiled
+
+    def invalidate_filters(self, guild_id: int) -> None:
+        self.filter_generation[guild_id] = self.filter_generation.get(guild_id, 0) + 1
+        self.filters.pop(guild_id, None)
+
     async def _log(self, guild: discord.Guild, title: str, description: str) -> None:
         channel_id = await self.bot.db.get_setting(guild.id, "log_channel_id")
         if not channel_id:
@@ -55,14 +178,14 @@ class CoreCog(commands.Cog):
             return True
         return False
 
-    async def _apply_automod(self, message: discord.Message) -> bool:
+    async def _apply_automod(self, message: discord.Message, settings: GuildSettings) -> bool:
         guild_id = message.guild.id
         member = message.author
         if isinstance(member, discord.Member) and member.guild_permissions.manage_messages:
             return False
 
-        anti_spam_msgs = int(await self.bot.db.get_setting(guild_id, "anti_spam_msgs") or 6)
-        anti_spam_window = int(await self.bot.db.get_setting(guild_id, "anti_spam_window") or 8)
+        anti_spam_msgs = int(settings["anti_spam_msgs"] or 6)
+        anti_spam_window = int(settings["anti_spam_window"] or 8)
         tracker = self.spam_tracker[guild_id][message.author.id]
         now = now_ts()
         tracker.append(now)
@@ -74,29 +197,26 @@ class CoreCog(commands.Cog):
             await self._log(message.guild, "AutoMod", f"Spam blocked from {message.author.mention}")
             return True
 
-        text = message.content.lower()
-        profanity_on = bool(await self.bot.db.get_setting(guild_id, "profanity_filter"))
-        if profanity_on:
-            bad_words = PROFANITY_WORDS | await self.bot.db.get_bad_words(guild_id)
-            if any(word in text for word in bad_words):
-                await message.delete()
-                await self._log(message.guild, "AutoMod", f"Bad word blocked from {message.author.mention}")
-                return True
-
-        regex_filters = await self.bot.db.get_regex_filters(guild_id)
-        for pattern in regex_filters:
-            if re.search(pattern, message.content, flags=re.IGNORECASE):
-                await message.delete()
-                await self._log(message.guild, "AutoMod", f"Regex `{pattern}` blocked from {message.author.mention}")
-                return True
-
-        link_filter = bool(await self.bot.db.get_setting(guild_id, "link_filter"))
+        content_filter = await self._filter(guild_id)
+        profanity_on = bool(settings["profanity_filter"])
+        if profanity_on and content_filter.match_word(message.content):
+            await message.delete()
+            await self._log(message.guild, "AutoMod", f"Bad word blocked from {message.author.mention}")
+            return True
+
+        pattern = content_filter.match_regex(message.content)
+        if pattern is not None:
+            await message.delete()
+            await self._log(message.guild, "AutoMod", f"Regex `{pattern}` blocked from {message.author.mention}")
+            return True
+
+        link_filter = bool(settings["link_filter"])
         if link_filter and re.search(r"https?://", message.content, flags=re.IGNORECASE):
             await message.delete()
             await message.channel.send(f"{message.author.mention} links are blocked here.", delete_after=5)
             return True
 
-        cap_threshold = float(await self.bot.db.get_setting(guild_id, "caps_threshold") or 0.8)
+        cap_threshold = float(settings["caps_threshold"] or 0.8)
         if len(message.content) >= 12 and clean_caps_ratio(message.content) > cap_threshold:
             await message.delete()
             await message.channel.send(f"{message.author.mention} too many caps.", delete_after=5)
@@ -104,26 +224,19 @@ class CoreCog(commands.Cog):
 
         return False
 
-    async def _handle_leveling(self, message: discord.Message) -> None:
-        rate = float(await self.bot.db.get_setting(message.guild.id, "xp_rate") or 1.0)
+    async def _handle_leveling(self, message: discord.Message, settings: GuildSettings) -> None:
+        rate = float(settings["xp_rate"] or 1.0)
         base = random.randint(15, 25)
         gain = int(base * rate)
 
-        user_row = await self.bot.db.get_user_row(message.guild.id, message.author.id)
-        new_xp = user_row["xp"] + gain
-        new_level = level_from_xp(new_xp)
-        await self.bot.db.set_user_field(message.guild.id, message.author.id, "xp", new_xp)
+        old_level, new_level = await self.xp.add(message.guild.id, message.author.id, gain)
 
-        if new_level > user_row["level"]:
-            await self.bot.db.set_user_field(message.guild.id, message.author.id, "level", new_level)
+        if new_level > old_level:
             await message.channel.send(f"{message.author.mention} leveled up to **{new_level}**.")
 
-            role_row = await self.bot.db.fetchone(
-                "SELECT role_id FROM level_roles WHERE guild_id = ? AND level = ?",
-                (message.guild.id, new_level),
-            )
-            if role_row and isinstance(message.author, discord.Member):
-                role = message.guild.get_role(role_row["role_id"])
+            role_id = await self._level_role_id(message.guild.id, new_level)
+            if role_id and isinstance(message.author, discord.Member):
+                role = message.guild.get_role(role_id)
                 if role:
                     await message.author.add_roles(role, reason="Level role reward")
 
@@ -153,8 +266,8 @@ class CoreCog(commands.Cog):
                     await ticket_channel.send(f"Opened for {message.author.mention} from workflow trigger.")
                 break
 
-    async def _handle_auto_thread(self, message: discord.Message) -> None:
-        channel_id = await self.bot.db.get_setting(message.guild.id, "auto_thread_channel_id")
+    async def _handle_auto_thread(self, message: discord.Message, settings: GuildSettings) -> None:
+        channel_id = settings["auto_thread_channel_id"]
         if not channel_id:
             return
         if message.channel.id != int(channel_id):
@@ -178,13 +291,14 @@ class CoreCog(commands.Cog):
         if await self._handle_custom_prefix_command(message):
             return
 
-        blocked = await self._apply_automod(message)
+        settings = await self.bot.db.get_settings(message.guild.id)
+        blocked = await self._apply_automod(message, settings)
         if blocked:
             return
 
-        await self._handle_leveling(message)
+        await self._handle_leveling(message, settings)
         await self._handle_auto_responses(message)
-        await self._handle_auto_thread(message)
+        await self._handle_auto_thread(message, settings)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member) -> None:
@@ -283,17 +397,9 @@ class CoreCog(commands.Cog):
             start = self.voice_join_ts.pop(key, None)
             if start:
                 seconds = max(0, now_ts() - start)
-                row = await self.bot.db.get_user_row(member.guild.id, member.id)
-                total = row["voice_seconds"] + seconds
-                await self.bot.db.set_user_field(member.guild.id, member.id, "voice_seconds", total)
                 rate = float(await self.bot.db.get_setting(member.guild.id, "xp_voice_rate") or 1.0)
-                xp_gain = int((seconds / 60.0) * 5 * rate)
-                if xp_gain > 0:
-                    new_xp = row["xp"] + xp_gain
-                    await self.bot.db.set_user_field(member.guild.id, member.id, "xp", new_xp)
-                    level = level_from_xp(new_xp)
-                    if level > row["level"]:
-                        await self.bot.db.set_user_field(member.guild.id, member.id, "level", level)
+                xp_gain = max(0, int((seconds / 60.0) * 5 * rate))
+                await self.xp.add(member.guild.id, member.id, xp_gain, voice_seconds=seconds)
 
 
 async def setup(bot: commands.Bot) -> None:
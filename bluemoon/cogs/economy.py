@@ -93,9 +93,11 @@ class EconomyCog(commands.Cog):
             return
         if random.random() < 0.45:
             stolen = min(target_row["wallet"], random.randint(50, 250))
-            await self.bot.db.add_balance(interaction.guild_id, target.id, wallet_delta=-stolen)
-            thief_bal = await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=stolen)
-            await interaction.response.send_message(f"Rob success: +{stolen}. Wallet: {thief_bal.wallet}")
+            balances = await self.bot.db.transfer(interaction.guild_id, {target.id: -stolen, interaction.user.id: stolen})
+            if balances is None:
+                await interaction.response.send_message("Target wallet too low.", ephemeral=True)
+                return
+            await interaction.response.send_message(f"Rob success: +{stolen}. Wallet: {balances[interaction.user.id].wallet}")
         else:
             fine = random.randint(40, 180)
             bal = await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-fine)
@@ -106,11 +108,10 @@ class EconomyCog(commands.Cog):
         if amount <= 0:
             await interaction.response.send_message("Amount must be positive.", ephemeral=True)
             return
-        row = await self.bot.db.get_user_row(interaction.guild_id, interaction.user.id)
-        if row["wallet"] < amount:
+        bal = await self.bot.db.try_add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-amount, bank_delta=amount)
+        if bal is None:
             await interaction.response.send_message("Not enough in wallet.", ephemeral=True)
             return
-        await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-amount, bank_delta=amount)
         await interaction.response.send_message(f"Deposited {amount}.")
 
     @economy.command(name="withdraw", description="Withdraw from bank")
@@ -118,11 +119,10 @@ class EconomyCog(commands.Cog):
         if amount <= 0:
             await interaction.response.send_message("Amount must be positive.", ephemeral=True)
             return
-        row = await self.bot.db.get_user_row(interaction.guild_id, interaction.user.id)
-        if row["bank"] < amount:
+        bal = await self.bot.db.try_add_balance(interaction.guild_id, interaction.user.id, wallet_delta=amount, bank_delta=-amount)
+        if bal is None:
             await interaction.response.send_message("Not enough in bank.", ephemeral=True)
             return
-        await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=amount, bank_delta=-amount)
         await interaction.response.send_message(f"Withdrew {amount}.")
 
     @economy.command(name="pay", description="Pay another user")
@@ -130,12 +130,10 @@ class EconomyCog(commands.Cog):
         if target.bot or target.id == interaction.user.id or amount <= 0:
             await interaction.response.send_message("Invalid payment target/amount.", ephemeral=True)
             return
-        row = await self.bot.db.get_user_row(interaction.guild_id, interaction.user.id)
-        if row["wallet"] < amount:
+        balances = await self.bot.db.transfer(interaction.guild_id, {interaction.user.id: -amount, target.id: amount})
+        if balances is None:
             await interaction.response.send_message("Insufficient wallet.", ephemeral=True)
             return
-        await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-amount)
-        await self.bot.db.add_balance(interaction.guild_id, target.id, wallet_delta=amount)
         await interaction.response.send_message(f"Sent {amount} to {target.mention}.")
 
     @economy.command(name="gamble", description="Gamble amount with coinflip odds")
@@ -143,16 +141,15 @@ class EconomyCog(commands.Cog):
         if amount <= 0:
             await interaction.response.send_message("Amount must be > 0.", ephemeral=True)
             return
-        row = await self.bot.db.get_user_row(interaction.guild_id, interaction.user.id)
-        if row["wallet"] < amount:
+        bal = await self.bot.db.try_add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-amount)
+        if bal is None:
             await interaction.response.send_message("Not enough wallet balance.", ephemeral=True)
             return
         if random.random() < 0.48:
             win = int(amount * 1.8)
-            await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=win)
+            await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=amount + win)
             await interaction.response.send_message(f"You won {win}.")
         else:
-            await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-amount)
             await interaction.response.send_message(f"You lost {amount}.")
 
     @economy.command(name="shop-add", description="Add item to shop")
@@ -160,18 +157,6 @@ class EconomyCog(commands.Cog):
         if not interaction.user.guild_permissions.manage_guild:
             await interaction.response.send_message("Manage Guild required.", ephemeral=True)
             return
-        await self.bot.db.execute(
-            """
-            CREATE TABLE IF NOT EXISTS shop_items (
-                guild_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                price INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                stock INTEGER,
-                PRIMARY KEY (guild_id, name)
-            )
-            """
-        )
         await self.bot.db.execute(
             "INSERT OR REPLACE INTO shop_items (guild_id, name, price, description, stock) VALUES (?, ?, ?, ?, COALESCE((SELECT stock FROM shop_items WHERE guild_id = ? AND name = ?), NULL))",
             (interaction.guild_id, name.lower(), max(price, 1), description[:200], interaction.guild_id, name.lower()),
@@ -196,13 +181,12 @@ class EconomyCog(commands.Cog):
         if not row:
             await interaction.response.send_message("Item not found.", ephemeral=True)
             return
-        user_row = await self.bot.db.get_user_row(interaction.guild_id, interaction.user.id)
-        if user_row["wallet"] < row["price"]:
+        bal = await self.bot.db.try_add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-row["price"])
+        if bal is None:
             await interaction.response.send_message("Not enough wallet balance.", ephemeral=True)
             return
-        await self.bot.db.add_balance(interaction.guild_id, interaction.user.id, wallet_delta=-row["price"])
-        inventory = await self.bot.db.add_inventory_item(interaction.guild_id, interaction.user.id, row["name"])
-        await interaction.response.send_message(f"Bought `{row['name']}`. Inventory size: {len(inventory)}")
+        owned = await self.bot.db.add_inventory_item(interaction.guild_id, interaction.user.id, row["name"])
+        await interaction.response.send_message(f"Bought `{row['name']}`. You now own {owned}.")
 
     @economy.command(name="inventory", description="View your inventory")
     async def inventory(self, interaction: discord.Interaction, member: discord.Member | None = None) -> None:
@@ -211,10 +195,7 @@ class EconomyCog(commands.Cog):
         if not inv:
             await interaction.response.send_message(f"{target.mention} inventory is empty.")
             return
-        counts: dict[str, int] = {}
-        for item in inv:
-            counts[item] = counts.get(item, 0) + 1
-        text = "\n".join([f"{name} x{qty}" for name, qty in sorted(counts.items())[:25]])
+        text = "\n".join([f"{name} x{qty}" for name, qty in list(inv.items())[:25]])
         await interaction.response.send_message(f"Inventory for {target.mention}:\n{text}")
 
 
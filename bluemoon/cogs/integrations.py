@@ -1,14 +1,31 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
+import heapq
 import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
 from typing import Optional
+from urllib.parse import urlsplit
 
 import aiohttp
 import discord
 import feedparser
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
+
+
+FEED_CONCURRENCY = 16
+FEED_PER_HOST = 2
+FEED_BATCH = 200
+FEED_MIN_INTERVAL = 300
+FEED_MAX_INTERVAL = 6 * 3600
+FEED_MAX_BACKOFF = 24 * 3600
+FEED_MAX_ENTRIES = 20
+FEED_MAX_POSTS = 5
 
 
 def normalize_source(feed_type: str, source: str) -> str:
@@ -28,13 +45,82 @@ def normalize_source(feed_type: str, source: str) -> str:
     return source
 
 
+FeedEntry = tuple[str, str, str]
+
+
+@dataclass
+class FeedFetch:
+    status: int
+    entries: list[FeedEntry] = field(default_factory=list)
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def parse_feed(text: str, source: str) -> list[FeedEntry]:
+    parsed = feedparser.parse(text)
+    entries = []
+    for entry in parsed.entries[:FEED_MAX_ENTRIES]:
+        item_id = entry.get("id") or entry.get("link") or hashlib.sha256(str(entry).encode()).hexdigest()
+        entries.append((item_id, entry.get("title", "New update"), entry.get("link", source)))
+    if entries:
+        return entries
+
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return [(digest, "Source changed", source)]
+
+
+def unseen_entries(entries: list[FeedEntry], last_item_id: Optional[str]) -> list[FeedEntry]:
+    if last_item_id is None:
+        return entries[:1]
+    limit = FEED_MAX_POSTS
+    for index, (item_id, _, _) in enumerate(entries):
+        if item_id == last_item_id:
+            limit = min(index, FEED_MAX_POSTS)
+            break
+    return list(reversed(entries[:limit]))
+
+
+def next_poll(interval: int, error_count: int, outcome: str) -> tuple[int, int, int]:
+    if outcome == "error":
+        error_count += 1
+        delay = min(FEED_MAX_BACKOFF, interval * 2 ** min(error_count, 10))
+    else:
+        if outcome == "changed":
+            interval = max(FEED_MIN_INTERVAL, interval // 2)
+        else:
+            interval = min(FEED_MAX_INTERVAL, int(interval * 1.5))
+        error_count = 0
+        delay = interval
+    return delay + random.randint(0, delay // 10), interval, error_count
+
+
+def interleave_hosts(sources: list[str]) -> list[str]:
+    by_host: dict[str, list[str]] = defaultdict(list)
+    for source in sources:
+        by_host[urlsplit(source).hostname or ""].append(source)
+    queues = list(by_host.values())
+    ordered: list[str] = []
+    while queues:
+        for queue in queues:
+            ordered.append(queue.pop(0))
+        queues = [q for q in queues if q]
+    return ordered
+
+
 class IntegrationsCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.feed_poller.start()
+        self.feed_queue: list[tuple[int, str]] = []
+        self.feed_due: dict[str, int] = {}
+        self.feed_wake = asyncio.Event()
+        self.feed_task: asyncio.Task[None] | None = None
+
+    async def cog_load(self) -> None:
+        self.feed_task = asyncio.create_task(self._run_feeds())
 
     def cog_unload(self) -> None:
-        self.feed_poller.cancel()
+        if self.feed_task:
+            self.feed_task.cancel()
 
     integrations = app_commands.Group(name="integrations", description="External integrations")
 
@@ -61,6 +147,7 @@ class IntegrationsCog(commands.Cog):
             "INSERT INTO integration_feeds (guild_id, feed_type, source, channel_id, last_item_id) VALUES (?, ?, ?, ?, NULL)",
             (interaction.guild_id, feed_type, normalized, channel.id),
         )
+        self._schedule_feed(normalized, int(time.time()))
         await interaction.response.send_message(f"Added {feed_type} integration -> {channel.mention}")
 
     @integrations.command(name="remove-feed", description="Remove feed by id")
@@ -88,52 +175,158 @@ class IntegrationsCog(commands.Cog):
         if not interaction.user.guild_permissions.manage_webhooks:
             await interaction.response.send_message("Manage Webhooks required.", ephemeral=True)
             return
-        async with aiohttp.ClientSession() as session:
-            async with session.post(webhook_url, json={"content": message[:1800]}, timeout=20) as resp:
-                code = resp.status
+        async with self.bot.http_client.post(webhook_url, json={"content": message[:1800]}) as resp:
+            code = resp.status
         await interaction.response.send_message(f"Webhook called: status={code}")
 
-    async def _fetch_feed_entry(self, source: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(source, timeout=20, headers={"User-Agent": "BlueMoonBot/1.0"}) as resp:
-                if resp.status != 200:
-                    return None, None, None
-                text = await resp.text()
-
-        parsed = feedparser.parse(text)
-        if parsed.entries:
-            entry = parsed.entries[0]
-            item_id = entry.get("id") or entry.get("link") or hashlib.sha256(str(entry).encode()).hexdigest()
-            title = entry.get("title", "New update")
-            link = entry.get("link", source)
-            return item_id, title, link
-
-        digest = hashlib.sha256(text.encode()).hexdigest()
-        return digest, "Source changed", source
-
-    @tasks.loop(minutes=5)
-    async def feed_poller(self) -> None:
+    def _schedule_feed(self, source: str, at: int) -> None:
+        current = self.feed_due.get(source)
+        if current is not None and current <= at:
+            return
+        self.feed_due[source] = at
+        heapq.heappush(self.feed_queue, (at, source))
+        self.feed_wake.set()
+
+    async def _run_feeds(self) -> None:
         await self.bot.wait_until_ready()
-        rows = await self.bot.db.fetchall("SELECT * FROM integration_feeds")
+        rows = await self.bot.db.fetchall("SELECT source, MIN(next_poll_at) AS due FROM integration_feeds GROUP BY source")
+        for row in rows:
+            self._schedule_feed(row["source"], row["due"])
+        while True:
+            now = int(time.time())
+            due: list[str] = []
+            while self.feed_queue and self.feed_queue[0][0] <= now and len(due) < FEED_BATCH:
+                at, source = heapq.heappop(self.feed_queue)
+                if self.feed_due.get(source) == at:
+                    del self.feed_due[source]
+                    due.append(source)
+            if due:
+                try:
+                    await self._poll_due(due)
+                except Exception as exc:
+                    print(f"Feed poll failed: {exc}")
+                    for source in due:
+                        self._schedule_feed(source, now + FEED_MIN_INTERVAL)
+                continue
+
+            timeout = self.feed_queue[0][0] - now if self.feed_queue else None
+            self.feed_wake.clear()
+            try:
+                await asyncio.wait_for(self.feed_wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fetch_feed(self, source: str, etag: Optional[str], last_modified: Optional[str]) -> FeedFetch:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        async with self.bot.http_client.get(source, headers=headers) as resp:
+            if resp.status != 200:
+                return FeedFetch(resp.status)
+            text = await resp.text()
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        entries = await asyncio.to_thread(parse_feed, text, source)
+        return FeedFetch(200, entries, etag, last_modified)
+
+    async def _poll_source(
+        self,
+        source: str,
+        subs: list[tuple[dict, discord.TextChannel]],
+        limit: asyncio.Semaphore,
+        host_limits: dict[str, asyncio.Semaphore],
+    ) -> tuple[str, list[tuple[str, Optional[str], Optional[str], int]]]:
+        etags = {row["etag"] for row, _ in subs}
+        modified = {row["last_modified"] for row, _ in subs}
+        etag = etags.pop() if len(etags) == 1 else None
+        last_modified = modified.pop() if len(modified) == 1 else None
+
+        async with host_limits[urlsplit(source).hostname or ""], limit:
+            try:
+                result = await self._fetch_feed(source, etag, last_modified)
+            except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError):
+                return "error", []
+        if result.status == 304:
+            return "unchanged", []
+        if result.status != 200 or not result.entries:
+            return "error", []
+
+        latest = result.entries[0][0]
+        outcome = "unchanged"
+        updates = []
+        for row, channel in subs:
+            updates.append((latest, result.etag, result.last_modified, row["id"]))
+            if row["last_item_id"] == latest:
+                continue
+            if row["last_item_id"] is not None:
+                outcome = "changed"
+            for _, title, link in unseen_entries(result.entries, row["last_item_id"]):
+                embed = discord.Embed(title=f"{row['feed_type'].upper()} update", description=title[:400], color=0x0084FF)
+                embed.url = link
+                try:
+                    await channel.send(embed=embed)
+                except discord.HTTPException:
+                    break
+        return outcome, updates
+
+    async def _poll_due(self, sources: list[str]) -> None:
+        placeholders = ",".join("?" * len(sources))
+        rows = await self.bot.db.fetchall(
+            f"SELECT * FROM integration_feeds WHERE source IN ({placeholders}) ORDER BY id",
+            tuple(sources),
+        )
+        first: dict[str, dict] = {}
+        by_source: dict[str, list[tuple[dict, discord.TextChannel]]] = defaultdict(list)
         for row in rows:
+            first.setdefault(row["source"], row)
             guild = self.bot.get_guild(row["guild_id"])
             if not guild:
                 continue
             channel = guild.get_channel(row["channel_id"])
             if not isinstance(channel, discord.TextChannel):
                 continue
-            item_id, title, link = await self._fetch_feed_entry(row["source"])
-            if not item_id:
-                continue
-            if row["last_item_id"] == item_id:
-                continue
-            await self.bot.db.execute(
-                "UPDATE integration_feeds SET last_item_id = ? WHERE id = ?",
-                (item_id, row["id"]),
+            by_source[row["source"]].append((row, channel))
+
+        now = int(time.time())
+        for source in first:
+            if source not in by_source:
+                self._schedule_feed(source, now + first[source]["poll_interval"])
+
+        limit = asyncio.Semaphore(FEED_CONCURRENCY)
+        host_limits: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(FEED_PER_HOST))
+        polled = interleave_hosts(list(by_source))
+        results = await asyncio.gather(
+            *(self._poll_source(source, by_source[source], limit, host_limits) for source in polled),
+            return_exceptions=True,
+        )
+
+        now = int(time.time())
+        schedule = []
+        updates = []
+        for source, result in zip(polled, results):
+            if isinstance(result, BaseException):
+                print(f"Feed poll failed for {source}: {result}")
+                outcome = "error"
+            else:
+                outcome, source_updates = result
+                updates.extend(source_updates)
+            delay, interval, error_count = next_poll(first[source]["poll_interval"], first[source]["error_count"], outcome)
+            schedule.append((now + delay, interval, error_count, source))
+            self._schedule_feed(source, now + delay)
+
+        if updates:
+            await self.bot.db.executemany(
+                "UPDATE integration_feeds SET last_item_id = ?, etag = ?, last_modified = ? WHERE id = ?",
+                updates,
+            )
+        if schedule:
+            await self.bot.db.executemany(
+                "UPDATE integration_feeds SET next_poll_at = ?, poll_interval = ?, error_count = ? WHERE source = ?",
+                schedule,
             )
-            embed = discord.Embed(title=f"{row['feed_type'].upper()} update", description=title[:400], color=0x0084FF)
-            embed.url = link
-            await channel.send(embed=embed)
 
 
 async def setup(bot: commands.Bot) -> None:
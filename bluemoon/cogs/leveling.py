@@ -11,11 +11,17 @@ class LevelingCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
 
+    async def _flush_xp(self) -> None:
+        core = self.bot.get_cog("CoreCog")
+        if core:
+            await core.xp.flush()
+
     level = app_commands.Group(name="level", description="Leveling and XP")
 
     @level.command(name="rank", description="Show rank card")
     async def rank(self, interaction: discord.Interaction, member: discord.Member | None = None) -> None:
         target = member or interaction.user
+        await self._flush_xp()
         row = await self.bot.db.get_user_row(interaction.guild_id, target.id)
         next_xp = xp_for_level(row["level"] + 1)
         current_level_floor = xp_for_level(row["level"])
@@ -33,6 +39,7 @@ class LevelingCog(commands.Cog):
 
     @level.command(name="leaderboard", description="XP leaderboard")
     async def leaderboard(self, interaction: discord.Interaction) -> None:
+        await self._flush_xp()
         rows = await self.bot.db.fetchall(
             "SELECT user_id, xp, level FROM user_state WHERE guild_id = ? ORDER BY xp DESC LIMIT 10",
             (interaction.guild_id,),
@@ -65,6 +72,9 @@ class LevelingCog(commands.Cog):
             "INSERT OR REPLACE INTO level_roles (guild_id, level, role_id) VALUES (?, ?, ?)",
             (interaction.guild_id, max(1, level), role.id),
         )
+        core = self.bot.get_cog("CoreCog")
+        if core:
+            core.invalidate_level_roles(interaction.guild_id)
         await interaction.response.send_message(f"Role reward set: level {level} -> {role.mention}")
 
 
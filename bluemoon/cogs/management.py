@@ -1,12 +1,90 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
 
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
 
+MASS_ROLE_CONCURRENCY = 4
+MASS_ROLE_BATCH = 50
+MASS_ROLE_PROGRESS_SECONDS = 5
+BACKUP_RESTORE_CONCURRENCY = 4
+
+
+def _snapshot_overwrites(channel: discord.abc.GuildChannel) -> list[dict[str, Any]]:
+    result = []
+    for target, overwrite in channel.overwrites.items():
+        allow, deny = overwrite.pair()
+        entry = {"type": "member", "id": target.id, "allow": allow.value, "deny": deny.value}
+        if isinstance(target, discord.Role):
+            entry.update(type="role", name=target.name, default=target.is_default())
+        result.append(entry)
+    return result
+
+
+def snapshot_guild(guild: discord.Guild) -> dict[str, Any]:
+    roles = [
+        {
+            "id": r.id,
+            "name": r.name,
+            "permissions": r.permissions.value,
+            "color": r.color.value,
+            "hoist": r.hoist,
+            "mentionable": r.mentionable,
+            "position": r.position,
+        }
+        for r in sorted(guild.roles, key=lambda r: r.position)
+        if not r.is_default() and not r.managed
+    ]
+    channels = []
+    for c in sorted(guild.channels, key=lambda c: (c.position, c.id)):
+        entry: dict[str, Any] = {
+            "id": c.id,
+            "name": c.name,
+            "type": str(c.type),
+            "category": c.category.name if c.category else None,
+            "position": c.position,
+            "overwrites": _snapshot_overwrites(c),
+        }
+        if isinstance(c, discord.TextChannel):
+            entry.update(topic=c.topic, slowmode=c.slowmode_delay, nsfw=c.nsfw)
+        elif isinstance(c, discord.VoiceChannel):
+            entry.update(bitrate=c.bitrate, user_limit=c.user_limit)
+        channels.append(entry)
+    return {
+        "guild": {"name": guild.name, "default_permissions": guild.default_role.permissions.value},
+        "roles": roles,
+        "channels": channels,
+    }
+
+
+@dataclass
+class RoleJob:
+    id: int
+    guild_id: int
+    actor_id: int
+    role_id: int
+    mode: str
+    channel_id: int | None = None
+    message_id: int | None = None
+    cursor: int = 0
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    cancel_requested: bool = False
+
+    def progress(self) -> str:
+        processed = self.done + self.failed
+        return f"Mass role `{self.mode}` job #{self.id}: {processed}/{self.total} processed, {self.done} updated, {self.failed} failed."
+
+
 class RoleButtonView(discord.ui.View):
     def __init__(self, role_id: int, label: str, style: discord.ButtonStyle = discord.ButtonStyle.primary):
         super().__init__(timeout=None)
@@ -37,10 +115,21 @@ class RoleButton(discord.ui.Button):
 class ManagementCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        self.role_jobs: dict[int, RoleJob] = {}
+        self.role_job_tasks: dict[int, asyncio.Task[None]] = {}
+        self.starting_role_jobs: set[int] = set()
+        self.resume_task: asyncio.Task[None] | None = None
         self.stats_updater.start()
 
+    async def cog_load(self) -> None:
+        self.resume_task = asyncio.create_task(self._resume_role_jobs())
+
     def cog_unload(self) -> None:
         self.stats_updater.cancel()
+        if self.resume_task:
+            self.resume_task.cancel()
+        for task in self.role_job_tasks.values():
+            task.cancel()
 
     async def _is_staff(self, interaction: discord.Interaction) -> bool:
         if not isinstance(interaction.user, discord.Member):
@@ -135,21 +224,162 @@ class ManagementCog(commands.Cog):
         if mode not in {"add", "remove"}:
             await interaction.response.send_message("Mode must be add/remove.", ephemeral=True)
             return
-        await interaction.response.defer(thinking=True)
-        count = 0
-        for member in interaction.guild.members:
-            if member.bot:
+        if interaction.guild_id in self.starting_role_jobs:
+            await interaction.response.send_message("A mass role job is already starting.", ephemeral=True)
+            return
+        running = self.role_jobs.get(interaction.guild_id)
+        if running:
+            await interaction.response.send_message(
+                f"Mass role job #{running.id} is still running. Use `/manage mass-role-cancel` to stop it.",
+                ephemeral=True,
+            )
+            return
+        if role.managed or role >= interaction.guild.me.top_role:
+            await interaction.response.send_message("I can't manage that role.", ephemeral=True)
+            return
+        self.starting_role_jobs.add(interaction.guild_id)
+        try:
+            await interaction.response.defer(thinking=True)
+            message = await interaction.followup.send(f"Mass role `{mode}` starting...", wait=True)
+            now = int(time.time())
+            rows = await self.bot.db.execute_returning(
+                """
+                INSERT INTO bulk_jobs (guild_id, actor_id, kind, role_id, mode, status, channel_id, message_id, created_at, updated_at)
+                VALUES (?, ?, 'mass_role', ?, ?, 'running', ?, ?, ?, ?) RETURNING id
+                """,
+                (interaction.guild_id, interaction.user.id, role.id, mode, interaction.channel_id, message.id, now, now),
+            )
+            job = RoleJob(rows[0]["id"], interaction.guild_id, interaction.user.id, role.id, mode, interaction.channel_id, message.id)
+            self._start_role_job(interaction.guild, job, message)
+        finally:
+            self.starting_role_jobs.discard(interaction.guild_id)
+
+    @manage.command(name="mass-role-cancel", description="Cancel the running mass role job")
+    async def mass_role_cancel(self, interaction: discord.Interaction) -> None:
+        if not await self._require_staff(interaction):
+            return
+        job = self.role_jobs.get(interaction.guild_id)
+        if not job:
+            await interaction.response.send_message("No mass role job is running.", ephemeral=True)
+            return
+        job.cancel_requested = True
+        await interaction.response.send_message(f"Cancelling mass role job #{job.id} after the current batch.")
+
+    def _start_role_job(self, guild: discord.Guild, job: RoleJob, message: discord.Message | None) -> None:
+        self.role_jobs[guild.id] = job
+        task = asyncio.create_task(self._run_role_job(guild, job, message))
+        self.role_job_tasks[guild.id] = task
+
+        def done(_: asyncio.Task[None]) -> None:
+            if self.role_job_tasks.get(guild.id) is task:
+                del self.role_job_tasks[guild.id]
+                self.role_jobs.pop(guild.id, None)
+
+        task.add_done_callback(done)
+
+    async def _resume_role_jobs(self) -> None:
+        await self.bot.wait_until_ready()
+        rows = await self.bot.db.fetchall("SELECT * FROM bulk_jobs WHERE kind = 'mass_role' AND status = 'running' ORDER BY id")
+        for row in rows:
+            guild = self.bot.get_guild(row["guild_id"])
+            if not guild or guild.id in self.role_jobs or guild.id in self.starting_role_jobs:
                 continue
+            job = RoleJob(
+                row["id"], row["guild_id"], row["actor_id"], row["role_id"], row["mode"],
+                row["channel_id"], row["message_id"], row["cursor"], row["total"], row["done_count"], row["failed_count"],
+            )
+            self._start_role_job(guild, job, None)
+
+    def _checkpoint_role_job(self, job: RoleJob, status: str) -> None:
+        self.bot.db.execute_nowait(
+            """
+            UPDATE bulk_jobs SET status = ?, cursor = ?, total = ?, done_count = ?, failed_count = ?, message_id = ?, updated_at = ?
+            WHERE id = ?
+            """,
+            (status, job.cursor, job.total, job.done, job.failed, job.message_id, int(time.time()), job.id),
+        )
+
+    async def _report_role_job(
+        self, guild: discord.Guild, job: RoleJob, message: discord.Message | discord.PartialMessage | None, content: str
+    ) -> discord.Message | discord.PartialMessage | None:
+        channel = guild.get_channel(job.channel_id) if job.channel_id else None
+        if message is None and job.message_id and isinstance(channel, discord.TextChannel):
+            message = channel.get_partial_message(job.message_id)
+        if message is not None:
             try:
-                if mode == "add" and role not in member.roles:
-                    await member.add_roles(role, reason=f"Mass role by {interaction.user}")
-                    count += 1
-                elif mode == "remove" and role in member.roles:
-                    await member.remove_roles(role, reason=f"Mass role by {interaction.user}")
-                    count += 1
+                await message.edit(content=content)
+                return message
             except discord.HTTPException:
-                continue
-        await interaction.followup.send(f"Mass role `{mode}` complete. Updated {count} members.")
+                pass
+        if not isinstance(channel, discord.TextChannel):
+            return None
+        try:
+            message = await channel.send(content)
+        except discord.HTTPException:
+            return None
+        job.message_id = message.id
+        return message
+
+    async def _run_role_job(self, guild: discord.Guild, job: RoleJob, message: discord.Message | None) -> None:
+        try:
+            role = guild.get_role(job.role_id)
+            if role is None:
+                self._checkpoint_role_job(job, "failed")
+                await self._report_role_job(guild, job, message, f"Mass role job #{job.id} stopped: role no longer exists.")
+                return
+            if not guild.chunked:
+                await guild.chunk()
+
+            adding = job.mode == "add"
+            targets = sorted(
+                (m for m in guild.members if not m.bot and m.id > job.cursor and (m.get_role(role.id) is None) == adding),
+                key=lambda m: m.id,
+            )
+            job.total = job.done + job.failed + len(targets)
+            actor = guild.get_member(job.actor_id)
+            reason = f"Mass role by {actor or job.actor_id}"
+            limit = asyncio.Semaphore(MASS_ROLE_CONCURRENCY)
+
+            async def apply(member: discord.Member) -> bool:
+                async with limit:
+                    try:
+                        if adding:
+                            await member.add_roles(role, reason=reason)
+                        else:
+                            await member.remove_roles(role, reason=reason)
+                        return True
+                    except discord.HTTPException:
+                        return False
+
+            message = await self._report_role_job(guild, job, message, job.progress())
+            last_report = time.monotonic()
+            for start in range(0, len(targets), MASS_ROLE_BATCH):
+                if job.cancel_requested:
+                    break
+                batch = targets[start : start + MASS_ROLE_BATCH]
+                results = await asyncio.gather(*(apply(m) for m in batch))
+                job.done += sum(results)
+                job.failed += len(results) - sum(results)
+                job.cursor = batch[-1].id
+                self._checkpoint_role_job(job, "running")
+                if time.monotonic() - last_report >= MASS_ROLE_PROGRESS_SECONDS:
+                    message = await self._report_role_job(guild, job, message, job.progress())
+                    last_report = time.monotonic()
+
+            if job.cancel_requested:
+                self._checkpoint_role_job(job, "cancelled")
+                await self._report_role_job(guild, job, message, f"Mass role job #{job.id} cancelled. Updated {job.done} members.")
+            else:
+                self._checkpoint_role_job(job, "done")
+                await self._report_role_job(guild, job, message, f"Mass role `{job.mode}` complete. Updated {job.done} members.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print(f"Mass role job {job.id} failed: {exc}")
+            self._checkpoint_role_job(job, "failed")
+            await self._report_role_job(
+                guild, job, message, f"Mass role job #{job.id} failed after updating {job.done} members: {exc}"
+            )
 
     @manage.command(name="auto-thread", description="Set channel for auto-thread creation")
     async def auto_thread(self, interaction: discord.Interaction, channel: discord.TextChannel | None = None) -> None:
@@ -173,42 +403,119 @@ class ManagementCog(commands.Cog):
     async def backup_create(self, interaction: discord.Interaction) -> None:
         if not await self._require_staff(interaction):
             return
-        data = {
-            "roles": [{"name": r.name, "permissions": r.permissions.value, "color": r.color.value} for r in interaction.guild.roles if not r.is_default()],
-            "channels": [{"name": c.name, "type": str(c.type), "category": c.category.name if c.category else None} for c in interaction.guild.channels],
-        }
-        await self.bot.db.execute(
-            "INSERT INTO analytics_events (guild_id, actor_id, event_type, payload, created_at) VALUES (?, ?, ?, ?, strftime('%s','now'))",
-            (interaction.guild_id, interaction.user.id, "server_backup", json.dumps(data)),
+        backup_id = await self.bot.db.save_backup(interaction.guild_id, interaction.user.id, snapshot_guild(interaction.guild))
+        row = await self.bot.db.fetchone("SELECT raw_size, stored_size FROM guild_backups WHERE id = ?", (backup_id,))
+        await interaction.response.send_message(
+            f"Server backup #{backup_id} saved ({row['raw_size'] // 1024} KB snapshot, {row['stored_size'] // 1024} KB new storage)."
         )
-        await interaction.response.send_message("Server backup snapshot saved.")
 
-    @manage.command(name="backup-restore", description="Restore latest backup channels")
-    async def backup_restore(self, interaction: discord.Interaction) -> None:
+    @manage.command(name="backup-list", description="List recent server backups")
+    async def backup_list(self, interaction: discord.Interaction) -> None:
         if not await self._require_staff(interaction):
             return
-        row = await self.bot.db.fetchone(
-            "SELECT payload FROM analytics_events WHERE guild_id = ? AND event_type = 'server_backup' ORDER BY id DESC LIMIT 1",
-            (interaction.guild_id,),
-        )
-        if not row:
-            await interaction.response.send_message("No backup found.", ephemeral=True)
+        rows = await self.bot.db.list_backups(interaction.guild_id)
+        if not rows:
+            await interaction.response.send_message("No backups found.", ephemeral=True)
             return
-        data = json.loads(row["payload"])
-        await interaction.response.defer(thinking=True)
-        categories: dict[str, discord.CategoryChannel] = {}
-        for ch in data.get("channels", []):
-            if ch.get("type") != "category" or ch["name"] in categories:
+        lines = [
+            f"#{r['id']} - {datetime.fromtimestamp(r['created_at'], tz=timezone.utc):%Y-%m-%d %H:%M} UTC by <@{r['created_by']}> ({r['raw_size'] // 1024} KB)"
+            for r in rows
+        ]
+        await interaction.response.send_message("\n".join(lines))
+
+    def _restore_overwrites(self, guild: discord.Guild, entry: dict[str, Any]) -> dict[Any, discord.PermissionOverwrite]:
+        result: dict[Any, discord.PermissionOverwrite] = {}
+        for ow in entry.get("overwrites", []):
+            if ow["type"] == "role":
+                if ow.get("default"):
+                    target = guild.default_role
+                else:
+                    target = guild.get_role(ow["id"]) or discord.utils.get(guild.roles, name=ow.get("name"))
+            else:
+                target = guild.get_member(ow["id"])
+            if target is not None:
+                result[target] = discord.PermissionOverwrite.from_pair(
+                    discord.Permissions(ow["allow"]), discord.Permissions(ow["deny"])
+                )
+        return result
+
+    async def _restore_channels(self, guild: discord.Guild, channels: list[dict[str, Any]]) -> tuple[int, int, int]:
+        limit = asyncio.Semaphore(BACKUP_RESTORE_CONCURRENCY)
+        existing = {(c.name, str(c.type), c.category.name if c.category else None) for c in guild.channels}
+        categories = {c.name: c for c in guild.categories}
+        created = skipped = failed = 0
+
+        async def create(entry: dict[str, Any]) -> discord.abc.GuildChannel | None:
+            nonlocal created, failed
+            kwargs: dict[str, Any] = {"overwrites": self._restore_overwrites(guild, entry), "reason": "Backup restore"}
+            if entry.get("position") is not None:
+                kwargs["position"] = entry["position"]
+            kind = entry.get("type")
+            if kind != "category":
+                kwargs["category"] = categories.get(entry.get("category"))
+            if kind == "text":
+                if entry.get("topic"):
+                    kwargs["topic"] = entry["topic"]
+                if entry.get("slowmode"):
+                    kwargs["slowmode_delay"] = entry["slowmode"]
+                if entry.get("nsfw"):
+                    kwargs["nsfw"] = True
+            elif kind == "voice":
+                if entry.get("bitrate"):
+                    kwargs["bitrate"] = min(int(entry["bitrate"]), int(guild.bitrate_limit))
+                if entry.get("user_limit"):
+                    kwargs["user_limit"] = entry["user_limit"]
+            async with limit:
+                try:
+                    if kind == "category":
+                        channel = await guild.create_category(entry["name"], **kwargs)
+                    elif kind == "voice":
+                        channel = await guild.create_voice_channel(entry["name"], **kwargs)
+                    else:
+                        channel = await guild.create_text_channel(entry["name"], **kwargs)
+                except discord.HTTPException:
+                    failed += 1
+                    return None
+            created += 1
+            return channel
+
+        pending_categories = []
+        for entry in channels:
+            if entry.get("type") != "category":
+                continue
+            if entry["name"] in categories or any(e["name"] == entry["name"] for e in pending_categories):
+                skipped += 1
                 continue
-            categories[ch["name"]] = await interaction.guild.create_category(ch["name"], reason="Backup restore")
+            pending_categories.append(entry)
+        for entry, channel in zip(pending_categories, await asyncio.gather(*(create(e) for e in pending_categories))):
+            if isinstance(channel, discord.CategoryChannel):
+                categories[entry["name"]] = channel
 
-        for ch in data.get("channels", []):
-            if ch.get("type") != "text":
+        pending = []
+        for entry in channels:
+            if entry.get("type") not in {"text", "voice"}:
+                continue
+            if (entry["name"], entry["type"], entry.get("category")) in existing:
+                skipped += 1
                 continue
-            category = categories.get(ch.get("category"))
-            await interaction.guild.create_text_channel(ch["name"], category=category, reason="Backup restore")
+            pending.append(entry)
+        await asyncio.gather(*(create(e) for e in pending))
+        return created, skipped, failed
 
-        await interaction.followup.send("Backup restore created channels from latest snapshot.")
+    @manage.command(name="backup-restore", description="Restore channels from a backup (latest by default)")
+    async def backup_restore(self, interaction: discord.Interaction, backup_id: int | None = None) -> None:
+        if not await self._require_staff(interaction):
+            return
+        loaded = await self.bot.db.load_backup(interaction.guild_id, backup_id)
+        if not loaded:
+            await interaction.response.send_message("No backup found.", ephemeral=True)
+            return
+        row, data = loaded
+        await interaction.response.defer(thinking=True)
+        created, skipped, failed = await self._restore_channels(interaction.guild, data.get("channels", []))
+        await interaction.followup.send(
+            f"Backup #{row['id']} restore created {created} channels ({skipped} already existed, {failed} failed)."
+        )
 
     @manage.command(name="template-export", description="Export bot settings template")
     async def template_export(self, interaction: discord.Interaction) -> None:
@@ -228,8 +535,10 @@ class ManagementCog(commands.Cog):
         except json.JSONDecodeError:
             await interaction.response.send_message("Invalid JSON.", ephemeral=True)
             return
-        for key, value in data.items():
-            await self.bot.db.set_setting(interaction.guild_id, key, value)
+        if not isinstance(data, dict):
+            await interaction.response.send_message("Template must be a JSON object.", ephemeral=True)
+            return
+        await self.bot.db.set_settings(interaction.guild_id, data)
         await interaction.response.send_message(f"Imported {len(data)} settings keys.")
 
     @tasks.loop(minutes=5)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+import re
 from datetime import timedelta
 
 import discord
@@ -30,6 +31,11 @@ class ModerationCog(commands.Cog):
         await interaction.response.send_message("Staff permissions required.", ephemeral=True)
         return False
 
+    def _invalidate_filters(self, guild_id: int) -> None:
+        core = self.bot.get_cog("CoreCog")
+        if core:
+            core.invalidate_filters(guild_id)
+
     mod = app_commands.Group(name="mod", description="Moderation and security")
 
     @mod.command(name="set-log-channel", description="Set moderation log channel")
@@ -105,6 +111,7 @@ class ModerationCog(commands.Cog):
             "INSERT OR IGNORE INTO bad_words (guild_id, word) VALUES (?, ?)",
             (interaction.guild_id, word),
         )
+        self._invalidate_filters(interaction.guild_id)
         await interaction.response.send_message(f"Added bad word: `{word}`")
 
     @mod.command(name="remove-badword", description="Remove blocked word")
@@ -115,16 +122,23 @@ class ModerationCog(commands.Cog):
             "DELETE FROM bad_words WHERE guild_id = ? AND word = ?",
             (interaction.guild_id, word.lower().strip()),
         )
+        self._invalidate_filters(interaction.guild_id)
         await interaction.response.send_message("Removed bad word filter.")
 
     @mod.command(name="add-regex", description="Add regex content filter")
     async def add_regex(self, interaction: discord.Interaction, pattern: str) -> None:
         if not await self._require_staff(interaction):
             return
+        try:
+            re.compile(pattern)
+        except re.error as exc:
+            await interaction.response.send_message(f"Invalid regex: {exc}", ephemeral=True)
+            return
         await self.bot.db.execute(
             "INSERT OR IGNORE INTO regex_filters (guild_id, pattern) VALUES (?, ?)",
             (interaction.guild_id, pattern),
         )
+        self._invalidate_filters(interaction.guild_id)
         await interaction.response.send_message(f"Added regex filter: `{pattern}`")
 
     @mod.command(name="warn", description="Warn a user")
@@ -1,16 +1,21 @@
 from __future__ import annotations
 
 import asyncio
+import random
 import re
+import time
 from collections import deque
 from dataclasses import dataclass, field
 from typing import Any
+from urllib.parse import parse_qs, urlsplit
 
 import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
-import yt_dlp
+
+from bluemoon.utils.cache import TTLCache
+from bluemoon.utils.ytdl import YtdlPool, normalize_query, stream_expiry
 
 
 YDL_OPTS = {
@@ -19,6 +24,54 @@ YDL_OPTS = {
     "default_search": "ytsearch",
     "noplaylist": True,
 }
+PLAYLIST_LIMIT = 500
+PLAYLIST_CHUNK = 50
+YDL_FLAT_OPTS = {
+    **YDL_OPTS,
+    "noplaylist": False,
+    "extract_flat": "in_playlist",
+    "playlistend": PLAYLIST_LIMIT,
+}
+YTDL_WORKERS = 2
+TRACK_CACHE_SIZE = 512
+TRACK_CACHE_TTL = 24 * 3600
+STREAM_DEFAULT_TTL = 3600
+STREAM_REFRESH_MARGIN = 600
+PREFETCH_AHEAD = 2
+RESUME_STAGGER = 3.0
+LYRICS_CACHE_SIZE = 256
+LYRICS_TTL = 30 * 86400
+LYRICS_MISS_TTL = 6 * 3600
+FFMPEG_BEFORE_OPTS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+
+
+def is_playlist_url(query: str) -> bool:
+    query = query.strip()
+    if not query.startswith(("http://", "https://")) or "open.spotify.com" in query:
+        return False
+    parts = urlsplit(query)
+    if "/playlist" in parts.path or "/sets/" in parts.path:
+        return True
+    params = parse_qs(parts.query)
+    if "v" in params or (parts.hostname or "").endswith("youtu.be"):
+        return False
+    return "list" in params
+
+
+def lyrics_key(artist: str, song: str) -> str:
+    return f"{normalize_query(artist)}|{normalize_query(song)}"
+
+
+@dataclass
+class ResolvedTrack:
+    title: str
+    stream_url: str
+    page_url: str
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at - STREAM_REFRESH_MARGIN > time.time()
 
 
 @dataclass
@@ -27,6 +80,12 @@ class Track:
     stream_url: str
     page_url: str
     requested_by: int
+    expires_at: float = 0.0
+    seq: int = 0
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at - STREAM_REFRESH_MARGIN > time.time()
 
 
 @dataclass
@@ -36,12 +95,121 @@ class GuildMusicState:
     loop: bool = False
     volume: float = 0.5
     stay_247: bool = False
+    voice_channel_id: int | None = None
+    next_seq: int = 1
+    prepared: tuple[Track, discord.AudioSource] | None = None
+    prefetch_task: asyncio.Task[None] | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def discard_prepared(self) -> None:
+        if self.prepared:
+            self.prepared[1].cleanup()
+            self.prepared = None
+
+    def reset(self) -> None:
+        self.queue.clear()
+        self.discard_prepared()
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
 
 
 class MusicCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
         self.states: dict[int, GuildMusicState] = {}
+        self.ytdl = YtdlPool(YDL_OPTS, size=YTDL_WORKERS)
+        self.ytdl_flat = YtdlPool(YDL_FLAT_OPTS, size=1)
+        self.resolved: TTLCache[str, ResolvedTrack] = TTLCache(TRACK_CACHE_SIZE, TRACK_CACHE_TTL)
+        self.resolved_aliases: TTLCache[str, str] = TTLCache(TRACK_CACHE_SIZE, TRACK_CACHE_TTL)
+        self.resume_task: asyncio.Task[None] | None = None
+        self.lyrics_cache: TTLCache[str, str] = TTLCache(LYRICS_CACHE_SIZE, LYRICS_TTL)
+        self.lyrics_inflight: dict[str, asyncio.Task[str | None]] = {}
+
+    async def cog_load(self) -> None:
+        self.resume_task = asyncio.create_task(self._resume_sessions())
+
+    def cog_unload(self) -> None:
+        if self.resume_task:
+            self.resume_task.cancel()
+        for state in self.states.values():
+            state.reset()
+        self.ytdl.shutdown()
+        self.ytdl_flat.shutdown()
+
+    def _checkpoint(self, guild_id: int) -> None:
+        state = self._state(guild_id)
+        self.bot.db.execute_nowait(
+            """
+            INSERT INTO music_state (guild_id, voice_channel_id, loop, volume, stay_247, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(guild_id) DO UPDATE SET
+                voice_channel_id = excluded.voice_channel_id,
+                loop = excluded.loop,
+                volume = excluded.volume,
+                stay_247 = excluded.stay_247,
+                updated_at = excluded.updated_at
+            """,
+            (guild_id, state.voice_channel_id, int(state.loop), state.volume, int(state.stay_247), int(time.time())),
+        )
+
+    def _enqueue(self, guild_id: int, tracks: list[Track]) -> None:
+        state = self._state(guild_id)
+        for track in tracks:
+            track.seq = state.next_seq
+            state.next_seq += 1
+            state.queue.append(track)
+        self.bot.db.executemany_nowait(
+            "INSERT OR REPLACE INTO music_queue (guild_id, seq, title, page_url, requested_by) VALUES (?, ?, ?, ?, ?)",
+            [(guild_id, t.seq, t.title, t.page_url, t.requested_by) for t in tracks],
+        )
+
+    def _forget(self, guild_id: int, track: Track) -> None:
+        self.bot.db.execute_nowait("DELETE FROM music_queue WHERE guild_id = ? AND seq = ?", (guild_id, track.seq))
+
+    def _set_voice_channel(self, guild_id: int, channel_id: int | None) -> None:
+        state = self._state(guild_id)
+        if state.voice_channel_id != channel_id:
+            state.voice_channel_id = channel_id
+            self._checkpoint(guild_id)
+
+    async def _resume_sessions(self) -> None:
+        await self.bot.wait_until_ready()
+        state_rows = await self.bot.db.fetchall("SELECT * FROM music_state")
+        queue_rows = await self.bot.db.fetchall("SELECT * FROM music_queue ORDER BY guild_id, seq")
+        restored = {row["guild_id"] for row in state_rows} | {row["guild_id"] for row in queue_rows}
+        restored -= set(self.states)
+        for row in queue_rows:
+            if row["guild_id"] not in restored:
+                continue
+            state = self._state(row["guild_id"])
+            state.queue.append(Track(row["title"], "", row["page_url"], row["requested_by"], seq=row["seq"]))
+            state.next_seq = row["seq"] + 1
+        for row in state_rows:
+            if row["guild_id"] not in restored:
+                continue
+            state = self._state(row["guild_id"])
+            state.loop = bool(row["loop"])
+            state.volume = row["volume"]
+            state.stay_247 = bool(row["stay_247"])
+            state.voice_channel_id = row["voice_channel_id"]
+
+        resumable = [row for row in state_rows if row["guild_id"] in restored and row["stay_247"] and row["voice_channel_id"]]
+        for index, row in enumerate(resumable):
+            if index:
+                await asyncio.sleep(RESUME_STAGGER + random.uniform(0, 1))
+            guild = self.bot.get_guild(row["guild_id"])
+            if not guild:
+                continue
+            channel = guild.get_channel(row["voice_channel_id"])
+            if not isinstance(channel, (discord.VoiceChannel, discord.StageChannel)):
+                continue
+            try:
+                if not guild.voice_client:
+                    await channel.connect()
+                await self._play_next(guild)
+            except (discord.ClientException, discord.HTTPException, asyncio.TimeoutError) as exc:
+                print(f"Music resume failed for guild {guild.id}: {exc}")
 
     def _state(self, guild_id: int) -> GuildMusicState:
         if guild_id not in self.states:
@@ -58,21 +226,102 @@ class MusicCog(commands.Cog):
             return True
         return any(r.id == int(role_id) for r in interaction.user.roles)
 
-    async def _extract_track(self, query: str, requester_id: int) -> Track | None:
-        if "open.spotify.com" in query:
-            raise ValueError("Spotify direct playback is not supported yet. Use a song name or YouTube URL.")
-        data = await asyncio.to_thread(lambda: yt_dlp.YoutubeDL(YDL_OPTS).extract_info(query, download=False))
+    async def _resolve(self, query: str, force: bool = False) -> ResolvedTrack | None:
+        key = normalize_query(query)
+        page_key = self.resolved_aliases.get(key) or key
+        cached = self.resolved.pop(page_key) if force else self.resolved.get(page_key)
+        if cached and cached.fresh and not force:
+            return cached
+        data = await self.ytdl.extract(cached.page_url if cached else query)
         if not data:
             return None
-        if "entries" in data and data["entries"]:
+        if "entries" in data:
+            if not data["entries"]:
+                return None
             data = data["entries"][0]
-        return Track(
+        resolved = ResolvedTrack(
             title=data.get("title", "Unknown title"),
             stream_url=data["url"],
             page_url=data.get("webpage_url", query),
+            expires_at=stream_expiry(data["url"], STREAM_DEFAULT_TTL),
+        )
+        page_key = normalize_query(resolved.page_url)
+        self.resolved.set(page_key, resolved)
+        if key != page_key:
+            self.resolved_aliases.set(key, page_key)
+        return resolved
+
+    async def _extract_track(self, query: str, requester_id: int) -> Track | None:
+        if "open.spotify.com" in query:
+            raise ValueError("Spotify direct playback is not supported yet. Use a song name or YouTube URL.")
+        resolved = await self._resolve(query)
+        if not resolved:
+            return None
+        return Track(
+            title=resolved.title,
+            stream_url=resolved.stream_url,
+            page_url=resolved.page_url,
             requested_by=requester_id,
+            expires_at=resolved.expires_at,
         )
 
+    async def _refresh_track(self, track: Track, force: bool = False) -> bool:
+        resolved = await self._resolve(track.page_url, force=force)
+        if not resolved:
+            return False
+        track.stream_url = resolved.stream_url
+        track.expires_at = resolved.expires_at
+        return True
+
+    async def _stream_ok(self, url: str) -> bool:
+        try:
+            async with self.bot.http_client.get(url, headers={"Range": "bytes=0-0"}) as resp:
+                return resp.status in (200, 206)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    def _ffmpeg(self, track: Track) -> discord.AudioSource:
+        return discord.FFmpegPCMAudio(track.stream_url, before_options=FFMPEG_BEFORE_OPTS, options="-vn")
+
+    def _schedule_prefetch(self, guild: discord.Guild) -> None:
+        state = self._state(guild.id)
+        if state.prefetch_task and not state.prefetch_task.done():
+            state.prefetch_task.cancel()
+        state.prefetch_task = asyncio.create_task(self._prefetch(state))
+
+    async def _prefetch(self, state: GuildMusicState) -> None:
+        for track in list(state.queue)[:PREFETCH_AHEAD]:
+            try:
+                if not track.fresh:
+                    await self._refresh_track(track)
+                elif not await self._stream_ok(track.stream_url):
+                    await self._refresh_track(track, force=True)
+            except Exception as exc:
+                print(f"Prefetch failed for {track.title}: {exc}")
+        if state.loop or not state.queue:
+            return
+        upcoming = state.queue[0]
+        if state.prepared and state.prepared[0] is upcoming:
+            return
+        state.discard_prepared()
+        if upcoming.fresh:
+            state.prepared = (upcoming, self._ffmpeg(upcoming))
+
+    async def _open_audio(self, state: GuildMusicState, track: Track) -> discord.AudioSource | None:
+        prepared, state.prepared = state.prepared, None
+        if prepared:
+            if prepared[0] is track and track.fresh:
+                return prepared[1]
+            prepared[1].cleanup()
+        if not track.fresh:
+            try:
+                if not await self._refresh_track(track):
+                    return None
+            except Exception as exc:
+                print(f"Could not refresh {track.title}: {exc}")
+                return None
+        return self._ffmpeg(track)
+
     async def _ensure_voice(self, interaction: discord.Interaction) -> discord.VoiceClient | None:
         if not isinstance(interaction.user, discord.Member) or not interaction.user.voice or not interaction.user.voice.channel:
             await interaction.response.send_message("Join a voice channel first.", ephemeral=True)
@@ -80,46 +329,54 @@ class MusicCog(commands.Cog):
         voice = interaction.guild.voice_client
         if voice and voice.channel != interaction.user.voice.channel:
             await voice.move_to(interaction.user.voice.channel)
-            return voice
-        if not voice:
+        elif not voice:
             voice = await interaction.user.voice.channel.connect()
+        self._set_voice_channel(interaction.guild_id, interaction.user.voice.channel.id)
         return voice
 
     async def _play_next(self, guild: discord.Guild) -> None:
-        voice = guild.voice_client
-        if not voice or voice.is_playing():
-            return
         state = self._state(guild.id)
-
-        if state.loop and state.now_playing:
-            track = state.now_playing
-        elif state.queue:
-            track = state.queue.popleft()
-            state.now_playing = track
-        else:
-            state.now_playing = None
-            if not state.stay_247:
-                try:
-                    await voice.disconnect()
-                except discord.HTTPException:
-                    pass
-            return
-
-        source = discord.PCMVolumeTransformer(
-            discord.FFmpegPCMAudio(
-                track.stream_url,
-                before_options="-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
-                options="-vn",
-            ),
-            volume=state.volume,
-        )
-
-        def after_play(err: Exception | None) -> None:
-            if err:
-                print(f"Playback error: {err}")
-            self.bot.loop.create_task(self._play_next(guild))
-
-        voice.play(source, after=after_play)
+        async with state.lock:
+            voice = guild.voice_client
+            if not voice or voice.is_playing():
+                return
+
+            while True:
+                if state.loop and state.now_playing:
+                    track = state.now_playing
+                else:
+                    if state.now_playing:
+                        self._forget(guild.id, state.now_playing)
+                    if not state.queue:
+                        state.now_playing = None
+                        if not state.stay_247:
+                            self._set_voice_channel(guild.id, None)
+                            try:
+                                await voice.disconnect()
+                            except discord.HTTPException:
+                                pass
+                        return
+                    track = state.queue.popleft()
+                    state.now_playing = track
+                audio = await self._open_audio(state, track)
+                if audio:
+                    break
+                print(f"Skipping unplayable track: {track.title}")
+                self._forget(guild.id, track)
+                state.now_playing = None
+
+            if not voice.is_connected():
+                audio.cleanup()
+                return
+            source = discord.PCMVolumeTransformer(audio, volume=state.volume)
+
+            def after_play(err: Exception | None) -> None:
+                if err:
+                    print(f"Playback error: {err}")
+                self.bot.loop.create_task(self._play_next(guild))
+
+            voice.play(source, after=after_play)
+        self._schedule_prefetch(guild)
 
         for channel in guild.text_channels:
             if channel.permissions_for(guild.me).send_messages:
@@ -135,6 +392,9 @@ class MusicCog(commands.Cog):
             return
 
         await interaction.response.defer(thinking=True)
+        if is_playlist_url(query):
+            await self._import_playlist(interaction, voice, query)
+            return
         try:
             track = await self._extract_track(query, interaction.user.id)
         except Exception as exc:
@@ -146,10 +406,88 @@ class MusicCog(commands.Cog):
             return
 
         state = self._state(interaction.guild_id)
-        state.queue.append(track)
+        self._enqueue(interaction.guild_id, [track])
         await interaction.followup.send(f"Queued: **{track.title}**")
         if not voice.is_playing():
             await self._play_next(interaction.guild)
+        elif len(state.queue) <= PREFETCH_AHEAD:
+            self._schedule_prefetch(interaction.guild)
+
+    async def _import_playlist(self, interaction: discord.Interaction, voice: discord.VoiceClient, query: str) -> None:
+        try:
+            data = await self.ytdl_flat.extract(query)
+        except Exception as exc:
+            await interaction.followup.send(f"Playlist lookup failed: {exc}")
+            return
+        entries = []
+        for entry in list((data or {}).get("entries") or [])[:PLAYLIST_LIMIT]:
+            page_url = entry and (entry.get("webpage_url") or entry.get("url"))
+            if page_url and entry.get("title") not in ("[Private video]", "[Deleted video]"):
+                entries.append((entry.get("title") or "Unknown title", page_url))
+        if not entries:
+            await interaction.followup.send("Could not find any playable tracks in that playlist.")
+            return
+
+        name = data.get("title") or "playlist"
+        total = len(entries)
+        message = await interaction.followup.send(f"Importing **{name}**: 0/{total}", wait=True)
+        for start in range(0, total, PLAYLIST_CHUNK):
+            chunk = entries[start : start + PLAYLIST_CHUNK]
+            self._enqueue(interaction.guild_id, [Track(title, "", url, interaction.user.id) for title, url in chunk])
+            if not voice.is_playing():
+                await self._play_next(interaction.guild)
+            elif start == 0:
+                self._schedule_prefetch(interaction.guild)
+            done = start + len(chunk)
+            content = f"Importing **{name}**: {done}/{total}" if done < total else f"Queued **{total}** tracks from **{name}**."
+            try:
+                await message.edit(content=content)
+            except discord.HTTPException:
+                pass
+
+    async def _lookup_lyrics(self, artist: str, song: str) -> str | None:
+        key = lyrics_key(artist, song)
+        cached = self.lyrics_cache.get(key)
+        if cached is not None:
+            return cached or None
+        task = self.lyrics_inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch_lyrics(key, artist, song))
+            self.lyrics_inflight[key] = task
+            task.add_done_callback(lambda _: self.lyrics_inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_lyrics(self, key: str, artist: str, song: str) -> str | None:
+        now = int(time.time())
+        row = await self.bot.db.fetchone("SELECT lyrics, fetched_at FROM lyrics_cache WHERE key = ?", (key,))
+        if row:
+            ttl = LYRICS_TTL if row["lyrics"] else LYRICS_MISS_TTL
+            remaining = row["fetched_at"] + ttl - now
+            if remaining > 0:
+                self.lyrics_cache.set(key, row["lyrics"] or "", ttl=remaining)
+                return row["lyrics"] or None
+
+        try:
+            async with self.bot.http_client.get(f"https://api.lyrics.ovh/v1/{artist}/{song}") as resp:
+                if resp.status == 404:
+                    text = None
+                elif resp.status != 200:
+                    return None
+                else:
+                    data = await resp.json()
+                    text = (data.get("lyrics") or "").strip() or None
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+        self.lyrics_cache.set(key, text or "", ttl=LYRICS_TTL if text else LYRICS_MISS_TTL)
+        self.bot.db.execute_nowait(
+            "INSERT OR REPLACE INTO lyrics_cache (key, lyrics, fetched_at) VALUES (?, ?, ?)",
+            (key, text, now),
+        )
+        return text
+
+    async def prune_lyrics(self) -> int:
+        return await self.bot.db.prune_lyrics_cache(LYRICS_TTL, LYRICS_MISS_TTL)
 
     @music.command(name="pause", description="Pause playback")
     async def pause(self, interaction: discord.Interaction) -> None:
@@ -207,6 +545,7 @@ class MusicCog(commands.Cog):
             return
         state = self._state(interaction.guild_id)
         state.loop = enabled
+        self._checkpoint(interaction.guild_id)
         await interaction.response.send_message(f"Loop set to {enabled}.")
 
     @music.command(name="volume", description="Set volume 0-150")
@@ -220,6 +559,7 @@ class MusicCog(commands.Cog):
         voice = interaction.guild.voice_client
         if voice and voice.source and isinstance(voice.source, discord.PCMVolumeTransformer):
             voice.source.volume = state.volume
+        self._checkpoint(interaction.guild_id)
         await interaction.response.send_message(f"Volume set to {percent}%")
 
     @music.command(name="disconnect", description="Disconnect from voice")
@@ -232,7 +572,11 @@ class MusicCog(commands.Cog):
             await interaction.response.send_message("Not connected.", ephemeral=True)
             return
         await voice.disconnect()
-        self._state(interaction.guild_id).queue.clear()
+        state = self._state(interaction.guild_id)
+        state.reset()
+        state.now_playing = None
+        self.bot.db.execute_nowait("DELETE FROM music_queue WHERE guild_id = ?", (interaction.guild_id,))
+        self._set_voice_channel(interaction.guild_id, None)
         await interaction.response.send_message("Disconnected.")
 
     @music.command(name="247", description="Toggle 24/7 mode")
@@ -241,6 +585,7 @@ class MusicCog(commands.Cog):
             await interaction.response.send_message("DJ role required.", ephemeral=True)
             return
         self._state(interaction.guild_id).stay_247 = enabled
+        self._checkpoint(interaction.guild_id)
         await interaction.response.send_message(f"24/7 mode set to {enabled}")
 
     @music.command(name="set-dj-role", description="Set DJ role")
@@ -266,14 +611,10 @@ class MusicCog(commands.Cog):
         artist = parts[0].strip()
         song = parts[1].strip()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.lyrics.ovh/v1/{artist}/{song}") as resp:
-                if resp.status != 200:
-                    await interaction.response.send_message("Lyrics not found.")
-                    return
-                data = await resp.json()
-
-        lyrics_text = data.get("lyrics", "No lyrics returned.")
+        lyrics_text = await self._lookup_lyrics(artist, song)
+        if not lyrics_text:
+            await interaction.response.send_message("Lyrics not found.")
+            return
         await interaction.response.send_message(f"Lyrics for **{title}**:\n{lyrics_text[:1800]}")
 
 
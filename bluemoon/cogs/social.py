@@ -21,6 +21,9 @@ class SocialCog(commands.Cog):
     @social.command(name="profile", description="View user profile")
     async def profile(self, interaction: discord.Interaction, member: discord.Member | None = None) -> None:
         target = member or interaction.user
+        core = self.bot.get_cog("CoreCog")
+        if core:
+            await core.xp.flush()
         row = await self.bot.db.get_user_row(interaction.guild_id, target.id)
         embed = discord.Embed(title=f"Profile: {target.display_name}", color=0x4DA6FF)
         embed.add_field(name="Reputation", value=str(row["reputation"]))
@@ -1,13 +1,50 @@
 from __future__ import annotations
 
 import asyncio
-import io
 import time
+from dataclasses import dataclass
 
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from bluemoon.utils.transcript import build_transcript, send_transcript
+
+
+@dataclass
+class OpenTicket:
+    id: int
+    guild_id: int
+    channel_id: int
+    opener_id: int
+    assigned_staff_id: int | None = None
+
+
+class OpenTicketIndex:
+    def __init__(self) -> None:
+        self.by_channel: dict[int, OpenTicket] = {}
+        self.by_opener: dict[tuple[int, int], OpenTicket] = {}
+
+    def add(self, ticket: OpenTicket) -> None:
+        self.by_channel[ticket.channel_id] = ticket
+        self.by_opener[(ticket.guild_id, ticket.opener_id)] = ticket
+
+    def remove(self, ticket: OpenTicket) -> None:
+        if self.by_channel.get(ticket.channel_id) is ticket:
+            del self.by_channel[ticket.channel_id]
+        if self.by_opener.get((ticket.guild_id, ticket.opener_id)) is ticket:
+            del self.by_opener[(ticket.guild_id, ticket.opener_id)]
+
+    def in_channel(self, guild_id: int, channel_id: int) -> OpenTicket | None:
+        ticket = self.by_channel.get(channel_id)
+        return ticket if ticket and ticket.guild_id == guild_id else None
+
+    def opened_by(self, guild_id: int, opener_id: int) -> OpenTicket | None:
+        return self.by_opener.get((guild_id, opener_id))
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.by_channel
+
 
 class TicketTypeButton(discord.ui.Button):
     def __init__(self, ticket_type: str, label: str, style: discord.ButtonStyle):
@@ -52,16 +89,53 @@ class TicketActionButton(discord.ui.Button):
 class TicketsCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
+        self.open_tickets = OpenTicketIndex()
+        self.creating: set[tuple[int, int]] = set()
+        self.activity: dict[int, tuple[int, int]] = {}
         self.sla_checker.start()
         self.auto_close_checker.start()
+        self.activity_flusher.start()
 
     async def cog_load(self) -> None:
         self.bot.add_view(TicketPanelView())
         self.bot.add_view(TicketActionsView())
+        rows = await self.bot.db.fetchall(
+            "SELECT id, guild_id, channel_id, opener_id, assigned_staff_id FROM tickets WHERE status = 'open' ORDER BY id"
+        )
+        index = OpenTicketIndex()
+        for row in rows:
+            index.add(OpenTicket(row["id"], row["guild_id"], row["channel_id"], row["opener_id"], row["assigned_staff_id"]))
+        self.open_tickets = index
 
-    def cog_unload(self) -> None:
+    async def cog_unload(self) -> None:
         self.sla_checker.cancel()
         self.auto_close_checker.cancel()
+        self.activity_flusher.cancel()
+        await self._flush_activity()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message) -> None:
+        if message.guild is None or message.channel.id not in self.open_tickets:
+            return
+        if self.bot.user and message.author.id == self.bot.user.id:
+            return
+        self.activity[message.channel.id] = (message.guild.id, int(message.created_at.timestamp()))
+
+    async def _flush_activity(self) -> None:
+        if not self.activity:
+            return
+        pending, self.activity = self.activity, {}
+        await self.bot.db.executemany(
+            "UPDATE tickets SET last_activity_at = MAX(COALESCE(last_activity_at, 0), ?) WHERE guild_id = ? AND channel_id = ? AND status = 'open'",
+            [(ts, guild_id, channel_id) for channel_id, (guild_id, ts) in pending.items()],
+        )
+
+    @tasks.loop(seconds=60)
+    async def activity_flusher(self) -> None:
+        try:
+            await self._flush_activity()
+        except Exception as exc:
+            print(f"Ticket activity flush failed: {exc}")
 
     async def _is_staff(self, member: discord.Member) -> bool:
         if member.guild_permissions.manage_guild:
@@ -75,18 +149,27 @@ class TicketsCog(commands.Cog):
             await interaction.response.send_message("Guild only.", ephemeral=True)
             return
 
-        existing = await self.bot.db.fetchone(
-            "SELECT * FROM tickets WHERE guild_id = ? AND opener_id = ? AND status = 'open'",
-            (guild.id, interaction.user.id),
-        )
+        key = (guild.id, interaction.user.id)
+        if key in self.creating:
+            await interaction.response.send_message("Your ticket is already being created.", ephemeral=True)
+            return
+        existing = self.open_tickets.opened_by(*key)
         if existing:
-            ch = guild.get_channel(existing["channel_id"])
+            ch = guild.get_channel(existing.channel_id)
             await interaction.response.send_message(
                 f"You already have an open ticket: {ch.mention if ch else '#deleted-channel'}",
                 ephemeral=True,
             )
             return
 
+        self.creating.add(key)
+        try:
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            await self._open_ticket(interaction, guild, ticket_type)
+        finally:
+            self.creating.discard(key)
+
+    async def _open_ticket(self, interaction: discord.Interaction, guild: discord.Guild, ticket_type: str) -> None:
         category_id = await self.bot.db.get_setting(guild.id, "ticket_category_id")
         category = guild.get_channel(int(category_id)) if category_id else None
         overwrites = {
@@ -107,30 +190,31 @@ class TicketsCog(commands.Cog):
             overwrites=overwrites,
             reason=f"Ticket {ticket_type}",
         )
-        await self.bot.db.execute(
-            "INSERT INTO tickets (guild_id, channel_id, opener_id, ticket_type, status, created_at) VALUES (?, ?, ?, ?, 'open', ?)",
-            (guild.id, channel.id, interaction.user.id, ticket_type, int(time.time())),
+        now = int(time.time())
+        sla_minutes = int(await self.bot.db.get_setting(guild.id, "ticket_sla_minutes") or 60)
+        rows = await self.bot.db.execute_returning(
+            "INSERT INTO tickets (guild_id, channel_id, opener_id, ticket_type, status, created_at, last_activity_at, sla_due_at) VALUES (?, ?, ?, ?, 'open', ?, ?, ?) RETURNING id",
+            (guild.id, channel.id, interaction.user.id, ticket_type, now, now, now + sla_minutes * 60),
         )
+        self.open_tickets.add(OpenTicket(rows[0]["id"], guild.id, channel.id, interaction.user.id))
         await channel.send(
             f"Ticket opened by {interaction.user.mention} ({ticket_type}).",
             view=TicketActionsView(),
         )
-        await interaction.response.send_message(f"Ticket created: {channel.mention}", ephemeral=True)
+        await interaction.followup.send(f"Ticket created: {channel.mention}", ephemeral=True)
 
     async def assign_ticket(self, interaction: discord.Interaction, staff_member: discord.Member) -> None:
         if not await self._is_staff(interaction.user):
             await interaction.response.send_message("Staff only action.", ephemeral=True)
             return
-        row = await self.bot.db.fetchone(
-            "SELECT * FROM tickets WHERE guild_id = ? AND channel_id = ? AND status = 'open'",
-            (interaction.guild.id, interaction.channel.id),
-        )
-        if not row:
+        ticket = self.open_tickets.in_channel(interaction.guild.id, interaction.channel.id)
+        if not ticket:
             await interaction.response.send_message("This channel is not an active ticket.", ephemeral=True)
             return
-        await self.bot.db.execute(
-            "UPDATE tickets SET assigned_staff_id = ? WHERE id = ?",
-            (staff_member.id, row["id"]),
+        ticket.assigned_staff_id = staff_member.id
+        self.bot.db.execute_nowait(
+            "UPDATE tickets SET assigned_staff_id = ?, sla_due_at = NULL WHERE id = ?",
+            (staff_member.id, ticket.id),
         )
         await interaction.response.send_message(f"Assigned to {staff_member.mention}.")
 
@@ -138,35 +222,36 @@ class TicketsCog(commands.Cog):
         if not await self._is_staff(interaction.user):
             await interaction.response.send_message("Staff only action.", ephemeral=True)
             return
-        row = await self.bot.db.fetchone(
-            "SELECT * FROM tickets WHERE guild_id = ? AND channel_id = ? AND status = 'open'",
-            (interaction.guild.id, interaction.channel.id),
-        )
-        if not row:
+        ticket = self.open_tickets.in_channel(interaction.guild.id, interaction.channel.id)
+        if not ticket:
             await interaction.response.send_message("No open ticket found in this channel.", ephemeral=True)
             return
 
+        await interaction.response.defer(thinking=True)
+        self.open_tickets.remove(ticket)
+        self.activity.pop(ticket.channel_id, None)
         await self.bot.db.execute(
             "UPDATE tickets SET status = 'closed', closed_at = ? WHERE id = ?",
-            (int(time.time()), row["id"]),
+            (int(time.time()), ticket.id),
         )
 
         transcript_channel_id = await self.bot.db.get_setting(interaction.guild.id, "ticket_transcript_channel")
         transcript_ch = interaction.guild.get_channel(int(transcript_channel_id)) if transcript_channel_id else None
 
-        transcript_lines: list[str] = []
-        async for msg in interaction.channel.history(limit=200, oldest_first=True):
-            transcript_lines.append(f"[{msg.created_at.isoformat()}] {msg.author}: {msg.content}")
-        transcript_data = "\n".join(transcript_lines).encode("utf-8")
-
         if isinstance(transcript_ch, discord.TextChannel):
-            file_obj = discord.File(io.BytesIO(transcript_data), filename=f"ticket-{interaction.channel.id}.txt")
-            await transcript_ch.send(
-                f"Transcript for {interaction.channel.mention} closed by {interaction.user.mention}. Reason: {reason}",
-                file=file_obj,
-            )
-
-        await interaction.response.send_message("Ticket closed. Channel will delete in 5 seconds.")
+            transcript = await build_transcript(interaction.channel)
+            try:
+                await send_transcript(
+                    transcript_ch.send,
+                    f"Transcript for {interaction.channel.mention} closed by {interaction.user.mention}. Reason: {reason}",
+                    transcript,
+                    f"ticket-{interaction.channel.id}",
+                    interaction.guild.filesize_limit,
+                )
+            finally:
+                transcript.close()
+
+        await interaction.followup.send("Ticket closed. Channel will delete in 5 seconds.")
         await interaction.channel.send("Please rate support with `/ticket feedback 1-5` before close if needed.")
         await asyncio.sleep(5)
         await interaction.channel.delete(reason="Ticket closed")
@@ -222,12 +307,18 @@ class TicketsCog(commands.Cog):
         if not await self._is_staff(interaction.user):
             await interaction.response.send_message("Staff only.", ephemeral=True)
             return
-        transcript_lines: list[str] = []
-        async for msg in interaction.channel.history(limit=200, oldest_first=True):
-            transcript_lines.append(f"[{msg.created_at.isoformat()}] {msg.author}: {msg.content}")
-        data = "\n".join(transcript_lines).encode("utf-8")
-        file_obj = discord.File(io.BytesIO(data), filename=f"transcript-{interaction.channel.id}.txt")
-        await interaction.response.send_message("Transcript export:", file=file_obj)
+        await interaction.response.defer(thinking=True)
+        transcript = await build_transcript(interaction.channel)
+        try:
+            await send_transcript(
+                interaction.followup.send,
+                "Transcript export:",
+                transcript,
+                f"transcript-{interaction.channel.id}",
+                interaction.guild.filesize_limit,
+            )
+        finally:
+            transcript.close()
 
     @ticket.command(name="feedback", description="Rate support 1-5")
     async def feedback(self, interaction: discord.Interaction, stars: app_commands.Range[int, 1, 5], comments: str = "") -> None:
@@ -247,33 +338,76 @@ class TicketsCog(commands.Cog):
         if not interaction.user.guild_permissions.manage_guild:
             await interaction.response.send_message("Manage Guild required.", ephemeral=True)
             return
-        await self.bot.db.set_setting(interaction.guild_id, "ticket_sla_minutes", max(1, minutes))
+        minutes = max(1, minutes)
+        await self.bot.db.set_setting(interaction.guild_id, "ticket_sla_minutes", minutes)
+        await self.bot.db.execute(
+            "UPDATE tickets SET sla_due_at = created_at + ? WHERE guild_id = ? AND status = 'open' AND sla_tier = 0 AND sla_due_at IS NOT NULL",
+            (minutes * 60, interaction.guild_id),
+        )
         await interaction.response.send_message(f"SLA set to {minutes} minutes.")
 
+    @ticket.command(name="sla-escalation", description="Set how many SLA warnings to send and who to escalate to")
+    async def sla_escalation(
+        self,
+        interaction: discord.Interaction,
+        tiers: app_commands.Range[int, 1, 5],
+        role: discord.Role | None = None,
+    ) -> None:
+        if not interaction.user.guild_permissions.manage_guild:
+            await interaction.response.send_message("Manage Guild required.", ephemeral=True)
+            return
+        await self.bot.db.set_settings(
+            interaction.guild_id,
+            {"ticket_sla_tiers": tiers, "ticket_escalation_role_id": role.id if role else None},
+        )
+        target = role.mention if role else "staff role"
+        await interaction.response.send_message(f"SLA warnings: {tiers}. Escalations after the first go to {target}.")
+
     @tasks.loop(minutes=2)
     async def sla_checker(self) -> None:
         await self.bot.wait_until_ready()
         now = int(time.time())
-        rows = await self.bot.db.fetchall("SELECT * FROM tickets WHERE status = 'open' AND assigned_staff_id IS NULL")
+        rows = await self.bot.db.fetchall(
+            "SELECT * FROM tickets WHERE status = 'open' AND sla_due_at <= ? ORDER BY guild_id",
+            (now,),
+        )
+        updates = []
+        settings = None
         for row in rows:
             guild = self.bot.get_guild(row["guild_id"])
             if not guild:
                 continue
-            sla_minutes = int(await self.bot.db.get_setting(guild.id, "ticket_sla_minutes") or 60)
-            if now - int(row["created_at"]) < sla_minutes * 60:
-                continue
+            if settings is None or settings.guild_id != guild.id:
+                settings = await self.bot.db.get_settings(guild.id)
+            tier = row["sla_tier"] + 1
+            max_tiers = int(settings["ticket_sla_tiers"] or 1)
+            next_due = now + int(settings["ticket_sla_minutes"] or 60) * 60 if tier < max_tiers else None
+            updates.append((tier, next_due, row["id"]))
+
             channel = guild.get_channel(row["channel_id"])
             if not isinstance(channel, discord.TextChannel):
                 continue
-            staff_role_id = await self.bot.db.get_setting(guild.id, "staff_role_id")
-            ping = f"<@&{staff_role_id}>" if staff_role_id else "Staff"
-            await channel.send(f"{ping} SLA warning: this ticket is waiting for assignment.")
+            role_id = settings["staff_role_id"]
+            if tier > 1 and settings["ticket_escalation_role_id"]:
+                role_id = settings["ticket_escalation_role_id"]
+            ping = f"<@&{role_id}>" if role_id else "Staff"
+            label = "SLA warning" if tier == 1 else f"SLA escalation {tier}/{max_tiers}"
+            try:
+                await channel.send(f"{ping} {label}: this ticket is waiting for assignment.")
+            except discord.HTTPException:
+                pass
+        if updates:
+            await self.bot.db.executemany("UPDATE tickets SET sla_tier = ?, sla_due_at = ? WHERE id = ?", updates)
 
     @tasks.loop(minutes=5)
     async def auto_close_checker(self) -> None:
         await self.bot.wait_until_ready()
-        rows = await self.bot.db.fetchall("SELECT * FROM tickets WHERE status = 'open'")
-        now = time.time()
+        await self._flush_activity()
+        cutoff = int(time.time()) - 72 * 3600
+        rows = await self.bot.db.fetchall(
+            "SELECT * FROM tickets WHERE status = 'open' AND last_activity_at <= ?",
+            (cutoff,),
+        )
         for row in rows:
             guild = self.bot.get_guild(row["guild_id"])
             if not guild:
@@ -281,22 +415,18 @@ class TicketsCog(commands.Cog):
             ch = guild.get_channel(row["channel_id"])
             if not isinstance(ch, discord.TextChannel):
                 continue
-            last = None
-            async for msg in ch.history(limit=1):
-                last = msg
-            if not last:
-                continue
-            idle_hours = (now - last.created_at.timestamp()) / 3600
-            if idle_hours >= 72:
-                try:
-                    await ch.send("Auto-closing due to 72h inactivity.")
-                    await self.bot.db.execute(
-                        "UPDATE tickets SET status='closed', closed_at=? WHERE id = ?",
-                        (int(time.time()), row["id"]),
-                    )
-                    await ch.delete(reason="Auto-close inactive ticket")
-                except discord.HTTPException:
-                    pass
+            try:
+                await ch.send("Auto-closing due to 72h inactivity.")
+                await self.bot.db.execute(
+                    "UPDATE tickets SET status='closed', closed_at=? WHERE id = ?",
+                    (int(time.time()), row["id"]),
+                )
+                ticket = self.open_tickets.in_channel(row["guild_id"], row["channel_id"])
+                if ticket:
+                    self.open_tickets.remove(ticket)
+                await ch.delete(reason="Auto-close inactive ticket")
+            except discord.HTTPException:
+                pass
 
 
 async def setup(bot: commands.Bot) -> None:
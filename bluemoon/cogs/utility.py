@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import ast
+import asyncio
 import io
 import math
 import operator
@@ -8,13 +9,13 @@ import random
 import time
 from datetime import datetime
 
-import aiohttp
 import discord
 import segno
 from discord import app_commands
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from bluemoon.utils.helpers import parse_duration_to_seconds, random_password
+from bluemoon.utils.scheduler import DeadlineScheduler, ScheduledJob
 
 
 SAFE_OPS = {
@@ -66,12 +67,69 @@ def convert_unit(value: float, from_unit: str, to_unit: str) -> float:
 class UtilityCog(commands.Cog):
     def __init__(self, bot: commands.Bot) -> None:
         self.bot = bot
-        self.reminder_loop.start()
-        self.scheduled_message_loop.start()
+        self.scheduler = DeadlineScheduler(self._load_jobs, self._fire_jobs)
+        self.scheduler_task: asyncio.Task[None] | None = None
+
+    async def cog_load(self) -> None:
+        self.scheduler_task = asyncio.create_task(self._run_scheduler())
+        self.scheduler_task.add_done_callback(self._scheduler_stopped)
 
     def cog_unload(self) -> None:
-        self.reminder_loop.cancel()
-        self.scheduled_message_loop.cancel()
+        if self.scheduler_task:
+            self.scheduler_task.cancel()
+
+    def _scheduler_stopped(self, task: asyncio.Task[None]) -> None:
+        if task.cancelled():
+            return
+        print(f"Reminder scheduler stopped unexpectedly: {task.exception()!r}")
+
+    async def _run_scheduler(self) -> None:
+        await self.bot.wait_until_ready()
+        await self.scheduler.run()
+
+    async def _load_jobs(self, until: float) -> tuple[list[ScheduledJob], float | None]:
+        jobs: list[ScheduledJob] = []
+        rows = await self.bot.db.fetchall("SELECT * FROM reminders WHERE remind_at <= ?", (int(until),))
+        jobs.extend(ScheduledJob(row["remind_at"], "reminder", row["id"], dict(row)) for row in rows)
+        rows = await self.bot.db.fetchall(
+            "SELECT * FROM scheduled_messages WHERE sent = 0 AND send_at <= ?",
+            (int(until),),
+        )
+        jobs.extend(ScheduledJob(row["send_at"], "message", row["id"], dict(row)) for row in rows)
+        row = await self.bot.db.fetchone(
+            """
+            SELECT
+                (SELECT min(remind_at) FROM reminders WHERE remind_at > ?) AS next_reminder,
+                (SELECT min(send_at) FROM scheduled_messages WHERE sent = 0 AND send_at > ?) AS next_message
+            """,
+            (int(until), int(until)),
+        )
+        candidates = [row[k] for k in ("next_reminder", "next_message") if row and row[k] is not None]
+        return jobs, (min(candidates) if candidates else None)
+
+    async def _fire_jobs(self, jobs: list[ScheduledJob]) -> None:
+        reminder_ids: list[tuple[int]] = []
+        message_ids: list[tuple[int]] = []
+        for job in jobs:
+            row = job.data
+            guild = self.bot.get_guild(row["guild_id"])
+            channel = guild.get_channel(row["channel_id"]) if guild else None
+            try:
+                if job.kind == "reminder":
+                    if isinstance(channel, discord.TextChannel):
+                        await channel.send(f"<@{row['user_id']}> reminder: {row['message']}")
+                elif isinstance(channel, discord.TextChannel):
+                    await channel.send(row["content"])
+            except discord.HTTPException:
+                pass
+            if job.kind == "reminder":
+                reminder_ids.append((job.job_id,))
+            else:
+                message_ids.append((job.job_id,))
+        if reminder_ids:
+            await self.bot.db.executemany("DELETE FROM reminders WHERE id = ?", reminder_ids)
+        if message_ids:
+            await self.bot.db.executemany("UPDATE scheduled_messages SET sent = 1 WHERE id = ?", message_ids)
 
     utility = app_commands.Group(name="utility", description="Utility and productivity")
 
@@ -83,10 +141,11 @@ class UtilityCog(commands.Cog):
             await interaction.response.send_message(str(exc), ephemeral=True)
             return
         remind_at = int(time.time()) + seconds
-        await self.bot.db.execute(
-            "INSERT INTO reminders (guild_id, user_id, channel_id, message, remind_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows = await self.bot.db.execute_returning(
+            "INSERT INTO reminders (guild_id, user_id, channel_id, message, remind_at, created_at) VALUES (?, ?, ?, ?, ?, ?) RETURNING *",
             (interaction.guild_id, interaction.user.id, interaction.channel_id, message[:350], remind_at, int(time.time())),
         )
+        self.scheduler.schedule(ScheduledJob(remind_at, "reminder", rows[0]["id"], dict(rows[0])))
         await interaction.response.send_message(f"Reminder set for {when}.")
 
     @utility.command(name="timer", description="Start a timer and ping when done")
@@ -95,10 +154,8 @@ class UtilityCog(commands.Cog):
 
     @utility.command(name="note-add", description="Add personal note")
     async def note_add(self, interaction: discord.Interaction, note: str) -> None:
-        notes = await self.bot.db.get_notes(interaction.guild_id, interaction.user.id)
-        notes.append(note[:240])
-        await self.bot.db.set_notes(interaction.guild_id, interaction.user.id, notes)
-        await interaction.response.send_message(f"Note saved. Total notes: {len(notes)}")
+        total = await self.bot.db.add_note(interaction.guild_id, interaction.user.id, note[:240])
+        await interaction.response.send_message(f"Note saved. Total notes: {total}")
 
     @utility.command(name="notes", description="List notes")
     async def notes(self, interaction: discord.Interaction) -> None:
@@ -111,21 +168,14 @@ class UtilityCog(commands.Cog):
 
     @utility.command(name="note-remove", description="Remove note by index")
     async def note_remove(self, interaction: discord.Interaction, index: int) -> None:
-        notes = await self.bot.db.get_notes(interaction.guild_id, interaction.user.id)
-        idx = index - 1
-        if idx < 0 or idx >= len(notes):
+        if not await self.bot.db.remove_note(interaction.guild_id, interaction.user.id, index - 1):
             await interaction.response.send_message("Invalid index.", ephemeral=True)
             return
-        notes.pop(idx)
-        await self.bot.db.set_notes(interaction.guild_id, interaction.user.id, notes)
         await interaction.response.send_message("Note removed.")
 
     @utility.command(name="todo-add", description="Add todo item")
     async def todo_add(self, interaction: discord.Interaction, text: str) -> None:
-        todos = await self.bot.db.get_todos(interaction.guild_id, interaction.user.id)
-        todo_id = (max([t["id"] for t in todos], default=0) + 1) if todos else 1
-        todos.append({"id": todo_id, "text": text[:200], "done": False})
-        await self.bot.db.set_todos(interaction.guild_id, interaction.user.id, todos)
+        todo_id = await self.bot.db.add_todo(interaction.guild_id, interaction.user.id, text[:200])
         await interaction.response.send_message(f"Todo #{todo_id} added.")
 
     @utility.command(name="todos", description="List todo items")
@@ -139,17 +189,9 @@ class UtilityCog(commands.Cog):
 
     @utility.command(name="todo-done", description="Mark todo done")
     async def todo_done(self, interaction: discord.Interaction, todo_id: int) -> None:
-        todos = await self.bot.db.get_todos(interaction.guild_id, interaction.user.id)
-        found = False
-        for todo in todos:
-            if todo["id"] == todo_id:
-                todo["done"] = True
-                found = True
-                break
-        if not found:
+        if not await self.bot.db.complete_todo(interaction.guild_id, interaction.user.id, todo_id):
             await interaction.response.send_message("Todo not found.", ephemeral=True)
             return
-        await self.bot.db.set_todos(interaction.guild_id, interaction.user.id, todos)
         await interaction.response.send_message(f"Todo #{todo_id} marked done.")
 
     @utility.command(name="calc", description="Calculator")
@@ -176,12 +218,11 @@ class UtilityCog(commands.Cog):
             "https://api.open-meteo.com/v1/forecast"
             f"?latitude={latitude}&longitude={longitude}&current=temperature_2m,wind_speed_10m,weather_code"
         )
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=20) as resp:
-                if resp.status != 200:
-                    await interaction.response.send_message("Weather lookup failed.", ephemeral=True)
-                    return
-                data = await resp.json()
+        async with self.bot.http_client.get(url) as resp:
+            if resp.status != 200:
+                await interaction.response.send_message("Weather lookup failed.", ephemeral=True)
+                return
+            data = await resp.json()
         current = data.get("current", {})
         await interaction.response.send_message(
             f"Temp: {current.get('temperature_2m')} C | Wind: {current.get('wind_speed_10m')} km/h | Code: {current.get('weather_code')}"
@@ -201,12 +242,11 @@ class UtilityCog(commands.Cog):
     @utility.command(name="translate", description="Translate text using LibreTranslate")
     async def translate(self, interaction: discord.Interaction, target_lang: str, text: str) -> None:
         payload = {"q": text, "source": "auto", "target": target_lang, "format": "text"}
-        async with aiohttp.ClientSession() as session:
-            async with session.post("https://libretranslate.de/translate", json=payload, timeout=20) as resp:
-                if resp.status != 200:
-                    await interaction.response.send_message("Translate API failed.", ephemeral=True)
-                    return
-                data = await resp.json()
+        async with self.bot.http_client.post("https://libretranslate.de/translate", json=payload) as resp:
+            if resp.status != 200:
+                await interaction.response.send_message("Translate API failed.", ephemeral=True)
+                return
+            data = await resp.json()
         await interaction.response.send_message(data.get("translatedText", "No translation returned."))
 
     @utility.command(name="qr", description="Generate QR code")
@@ -234,41 +274,13 @@ class UtilityCog(commands.Cog):
             await interaction.response.send_message(str(exc), ephemeral=True)
             return
         send_at = int(time.time()) + seconds
-        await self.bot.db.execute(
-            "INSERT INTO scheduled_messages (guild_id, channel_id, content, send_at, created_by, sent) VALUES (?, ?, ?, ?, ?, 0)",
+        rows = await self.bot.db.execute_returning(
+            "INSERT INTO scheduled_messages (guild_id, channel_id, content, send_at, created_by, sent) VALUES (?, ?, ?, ?, ?, 0) RETURNING *",
             (interaction.guild_id, interaction.channel_id, content[:1800], send_at, interaction.user.id),
         )
+        self.scheduler.schedule(ScheduledJob(send_at, "message", rows[0]["id"], dict(rows[0])))
         await interaction.response.send_message("Scheduled message created.")
 
-    @tasks.loop(seconds=30)
-    async def reminder_loop(self) -> None:
-        await self.bot.wait_until_ready()
-        now = int(time.time())
-        rows = await self.bot.db.fetchall("SELECT * FROM reminders WHERE remind_at <= ?", (now,))
-        for row in rows:
-            guild = self.bot.get_guild(row["guild_id"])
-            if guild:
-                channel = guild.get_channel(row["channel_id"])
-                if isinstance(channel, discord.TextChannel):
-                    await channel.send(f"<@{row['user_id']}> reminder: {row['message']}")
-            await self.bot.db.execute("DELETE FROM reminders WHERE id = ?", (row["id"],))
-
-    @tasks.loop(seconds=30)
-    async def scheduled_message_loop(self) -> None:
-        await self.bot.wait_until_ready()
-        now = int(time.time())
-        rows = await self.bot.db.fetchall(
-            "SELECT * FROM scheduled_messages WHERE send_at <= ? AND sent = 0",
-            (now,),
-        )
-        for row in rows:
-            guild = self.bot.get_guild(row["guild_id"])
-            if guild:
-                channel = guild.get_channel(row["channel_id"])
-                if isinstance(channel, discord.TextChannel):
-                    await channel.send(row["content"])
-            await self.bot.db.execute("UPDATE scheduled_messages SET sent = 1 WHERE id = ?", (row["id"],))
-
 
 async def setup(bot: commands.Bot) -> None:
     cog = UtilityCog(bot)
@@ -16,6 +16,32 @@ class Settings:
     prefix: str
     database_path: str
     timezone: str
+    db_write_batch_ms: int
+    db_write_batch_size: int
+    db_readers: int
+    db_reader_queue_depth: int
+    analytics_retention: dict[str, int | None]
+    analytics_archive_dir: str | None
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    return int(raw) if raw.isdigit() else default
+
+
+def _parse_retention(raw: str) -> dict[str, int | None]:
+    policy: dict[str, int | None] = {}
+    for part in raw.split(","):
+        if "=" not in part:
+            continue
+        event_type, days = (p.strip() for p in part.split("=", 1))
+        if not event_type:
+            continue
+        if days.lower() in {"forever", "keep", ""}:
+            policy[event_type] = None
+        elif days.isdigit():
+            policy[event_type] = int(days)
+    return policy
 
 
 def load_settings() -> Settings:
@@ -36,4 +62,12 @@ def load_settings() -> Settings:
         prefix=os.getenv("BOT_PREFIX", "!").strip() or "!",
         database_path=os.getenv("DATABASE_PATH", "data/bluemoon.sqlite3").strip(),
         timezone=os.getenv("DEFAULT_TIMEZONE", "UTC").strip() or "UTC",
+        db_write_batch_ms=_env_int("DB_WRITE_BATCH_MS", 20),
+        db_write_batch_size=_env_int("DB_WRITE_BATCH_SIZE", 200),
+        db_readers=_env_int("DB_READERS", 2),
+        db_reader_queue_depth=_env_int("DB_READER_QUEUE_DEPTH", 8),
+        analytics_retention=_parse_retention(
+            os.getenv("ANALYTICS_RETENTION", "message_create=14,message_delete=90,*=forever")
+        ),
+        analytics_archive_dir=os.getenv("ANALYTICS_ARCHIVE_DIR", "").strip() or None,
     )
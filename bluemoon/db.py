@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import gzip
+import hashlib
 import json
 import os
 import time
+import zlib
 from dataclasses import dataclass
-from typing import Any
+from datetime import datetime, timezone
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Mapping
 
 import aiosqlite
 
@@ -27,6 +34,8 @@ DEFAULT_GUILD_SETTINGS: dict[str, Any] = {
     "ticket_transcript_channel": None,
     "ticket_feedback_channel": None,
     "ticket_sla_minutes": 60,
+    "ticket_sla_tiers": 1,
+    "ticket_escalation_role_id": None,
     "xp_rate": 1.0,
     "xp_voice_rate": 1.0,
     "economy_daily": 200,
@@ -42,20 +51,393 @@ DEFAULT_GUILD_SETTINGS: dict[str, Any] = {
 }
 
 
+def _encode_sections(sections: Mapping[str, Any]) -> list[tuple[str, str, bytes, int]]:
+    encoded = []
+    for name, value in sections.items():
+        raw = json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        encoded.append((name, hashlib.sha256(raw).hexdigest(), zlib.compress(raw, 6), len(raw)))
+    return encoded
+
+
+def _decode_sections(manifest: Mapping[str, str], blobs: Mapping[str, bytes]) -> dict[str, Any]:
+    return {name: json.loads(zlib.decompress(blobs[digest])) for name, digest in manifest.items() if digest in blobs}
+
+
+async def _insert_backup(
+    conn: aiosqlite.Connection, guild_id: int, created_by: int, created_at: int, encoded: list[tuple[str, str, bytes, int]]
+) -> int:
+    stored = 0
+    for _, digest, blob, size in encoded:
+        cur = await conn.execute(
+            "INSERT OR IGNORE INTO backup_sections (hash, data, size) VALUES (?, ?, ?)",
+            (digest, blob, size),
+        )
+        if cur.rowcount:
+            stored += len(blob)
+    async with conn.execute(
+        """
+        INSERT INTO guild_backups (guild_id, created_by, created_at, sections, raw_size, stored_size)
+        VALUES (?, ?, ?, ?, ?, ?) RETURNING id
+        """,
+        (
+            guild_id,
+            created_by,
+            created_at,
+            json.dumps({name: digest for name, digest, _, _ in encoded}),
+            sum(size for _, _, _, size in encoded),
+            stored,
+        ),
+    ) as cur:
+        row = await cur.fetchone()
+    return row[0]
+
+
+async def _move_legacy_backups(conn: aiosqlite.Connection) -> None:
+    async with conn.execute(
+        "SELECT id, guild_id, actor_id, payload, created_at FROM analytics_events WHERE event_type = 'server_backup' ORDER BY id"
+    ) as cur:
+        rows = await cur.fetchall()
+    moved = []
+    for row_id, guild_id, actor_id, payload, created_at in rows:
+        try:
+            sections = json.loads(payload)
+        except json.JSONDecodeError:
+            continue
+        encoded = await asyncio.to_thread(_encode_sections, sections)
+        await _insert_backup(conn, guild_id, actor_id or 0, int(created_at), encoded)
+        moved.append((row_id,))
+    await conn.executemany("DELETE FROM analytics_events WHERE id = ?", moved)
+
+
+MigrationStep = str | Callable[[aiosqlite.Connection], Awaitable[None]]
+
+MIGRATIONS: list[tuple[int, MigrationStep]] = [
+    (
+        1,
+        """
+        CREATE INDEX IF NOT EXISTS idx_analytics_guild_type_time
+            ON analytics_events (guild_id, event_type, created_at);
+        CREATE INDEX IF NOT EXISTS idx_reminders_remind_at ON reminders (remind_at);
+        CREATE INDEX IF NOT EXISTS idx_scheduled_sent_send_at ON scheduled_messages (sent, send_at);
+        CREATE INDEX IF NOT EXISTS idx_tickets_guild_channel_status ON tickets (guild_id, channel_id, status);
+        CREATE INDEX IF NOT EXISTS idx_tickets_guild_opener_status ON tickets (guild_id, opener_id, status);
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_assigned ON tickets (status, assigned_staff_id);
+        CREATE INDEX IF NOT EXISTS idx_warnings_guild_user ON warnings (guild_id, user_id);
+        CREATE INDEX IF NOT EXISTS idx_user_state_guild_xp ON user_state (guild_id, xp DESC);
+        """,
+    ),
+    (
+        2,
+        """
+        CREATE TABLE IF NOT EXISTS shop_items (
+            guild_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            stock INTEGER,
+            PRIMARY KEY (guild_id, name)
+        );
+        """,
+    ),
+    (
+        3,
+        """
+        CREATE TABLE IF NOT EXISTS analytics_hourly (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, bucket)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS analytics_daily (
+            guild_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, event_type, bucket)
+        ) WITHOUT ROWID;
+
+        INSERT OR REPLACE INTO analytics_hourly (guild_id, event_type, bucket, count)
+        SELECT guild_id, event_type, created_at - created_at % 3600, COUNT(*)
+        FROM analytics_events GROUP BY guild_id, event_type, created_at - created_at % 3600;
+
+        INSERT OR REPLACE INTO analytics_daily (guild_id, event_type, bucket, count)
+        SELECT guild_id, event_type, created_at - created_at % 86400, COUNT(*)
+        FROM analytics_events GROUP BY guild_id, event_type, created_at - created_at % 86400;
+        """,
+    ),
+    (
+        4,
+        """
+        CREATE INDEX IF NOT EXISTS idx_analytics_type_time ON analytics_events (event_type, created_at);
+        """,
+    ),
+    (
+        5,
+        """
+        CREATE TABLE IF NOT EXISTS inventory (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            item TEXT NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, item)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_notes_guild_user ON notes (guild_id, user_id, id);
+
+        CREATE TABLE IF NOT EXISTS todos (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            todo_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, todo_id)
+        ) WITHOUT ROWID;
+
+        INSERT INTO inventory (guild_id, user_id, item, qty)
+        SELECT u.guild_id, u.user_id, j.value, COUNT(*)
+        FROM user_state u, json_each(u.inventory_json) j
+        WHERE json_valid(u.inventory_json) AND j.type = 'text'
+        GROUP BY u.guild_id, u.user_id, j.value;
+
+        INSERT INTO notes (guild_id, user_id, content, created_at)
+        SELECT u.guild_id, u.user_id, j.value, CAST(strftime('%s', 'now') AS INTEGER)
+        FROM user_state u, json_each(u.notes_json) j
+        WHERE json_valid(u.notes_json) AND j.type = 'text'
+        ORDER BY u.guild_id, u.user_id, j.key;
+
+        INSERT OR IGNORE INTO todos (guild_id, user_id, todo_id, text, done)
+        SELECT u.guild_id, u.user_id, json_extract(j.value, '$.id'), json_extract(j.value, '$.text'),
+               COALESCE(json_extract(j.value, '$.done'), 0)
+        FROM user_state u, json_each(u.todos_json) j
+        WHERE json_valid(u.todos_json) AND json_extract(j.value, '$.id') IS NOT NULL
+          AND json_extract(j.value, '$.text') IS NOT NULL;
+
+        UPDATE user_state SET inventory_json = '[]', notes_json = '[]', todos_json = '[]'
+        WHERE inventory_json != '[]' OR notes_json != '[]' OR todos_json != '[]';
+        """,
+    ),
+    (
+        6,
+        """
+        ALTER TABLE integration_feeds ADD COLUMN etag TEXT;
+        ALTER TABLE integration_feeds ADD COLUMN last_modified TEXT;
+        CREATE INDEX IF NOT EXISTS idx_integration_feeds_source ON integration_feeds (source);
+        """,
+    ),
+    (
+        7,
+        """
+        ALTER TABLE integration_feeds ADD COLUMN next_poll_at INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE integration_feeds ADD COLUMN poll_interval INTEGER NOT NULL DEFAULT 300;
+        ALTER TABLE integration_feeds ADD COLUMN error_count INTEGER NOT NULL DEFAULT 0;
+        """,
+    ),
+    (
+        8,
+        """
+        CREATE TABLE IF NOT EXISTS music_state (
+            guild_id INTEGER PRIMARY KEY,
+            voice_channel_id INTEGER,
+            loop INTEGER NOT NULL DEFAULT 0,
+            volume REAL NOT NULL DEFAULT 0.5,
+            stay_247 INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS music_queue (
+            guild_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            page_url TEXT NOT NULL,
+            requested_by INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, seq)
+        ) WITHOUT ROWID;
+        """,
+    ),
+    (
+        9,
+        """
+        CREATE TABLE IF NOT EXISTS lyrics_cache (
+            key TEXT PRIMARY KEY,
+            lyrics TEXT,
+            fetched_at INTEGER NOT NULL
+        );
+        """,
+    ),
+    (
+        10,
+        """
+        ALTER TABLE tickets ADD COLUMN last_activity_at INTEGER;
+        UPDATE tickets SET last_activity_at = CASE
+            WHEN status = 'open' THEN CAST(strftime('%s', 'now') AS INTEGER)
+            ELSE COALESCE(closed_at, created_at)
+        END;
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_activity ON tickets (status, last_activity_at);
+        """,
+    ),
+    (
+        11,
+        """
+        ALTER TABLE tickets ADD COLUMN sla_due_at INTEGER;
+        ALTER TABLE tickets ADD COLUMN sla_tier INTEGER NOT NULL DEFAULT 0;
+        UPDATE tickets SET sla_due_at = created_at + 60 * COALESCE(
+            (SELECT CAST(s.value AS INTEGER) FROM guild_settings s WHERE s.guild_id = tickets.guild_id AND s.key = 'ticket_sla_minutes'),
+            60
+        )
+        WHERE status = 'open' AND assigned_staff_id IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_tickets_status_sla ON tickets (status, sla_due_at);
+        """,
+    ),
+    (
+        12,
+        """
+        CREATE TABLE IF NOT EXISTS bulk_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            actor_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            role_id INTEGER NOT NULL,
+            mode TEXT NOT NULL,
+            status TEXT NOT NULL,
+            cursor INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            done_count INTEGER NOT NULL DEFAULT 0,
+            failed_count INTEGER NOT NULL DEFAULT 0,
+            channel_id INTEGER,
+            message_id INTEGER,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_bulk_jobs_status ON bulk_jobs (status);
+        """,
+    ),
+    (
+        13,
+        """
+        CREATE TABLE IF NOT EXISTS backup_sections (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS guild_backups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            sections TEXT NOT NULL,
+            raw_size INTEGER NOT NULL,
+            stored_size INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_guild_backups_guild ON guild_backups (guild_id, id);
+        """,
+    ),
+    (14, _move_legacy_backups),
+    (
+        15,
+        """
+        CREATE INDEX IF NOT EXISTS idx_lyrics_cache_fetched ON lyrics_cache (fetched_at);
+        """,
+    ),
+]
+
+
 def now_ts() -> int:
     return int(time.time())
 
 
+def _append_ndjson_gz(path: str, rows: list[dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+
+def _report_write_error(future: asyncio.Future[Any]) -> None:
+    if future.cancelled():
+        return
+    exc = future.exception()
+    if exc is not None:
+        print(f"Deferred database write failed: {exc}")
+
+
 @dataclass
 class Balance:
     wallet: int
     bank: int
 
 
+@dataclass(frozen=True)
+class GuildSettings:
+    guild_id: int
+    values: Mapping[str, Any]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values.get(key)
+
+    def with_value(self, key: str, value: Any) -> GuildSettings:
+        values = dict(self.values)
+        values[key] = value
+        return GuildSettings(guild_id=self.guild_id, values=MappingProxyType(values))
+
+
+WriteFn = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+@dataclass
+class _WriteJob:
+    run: WriteFn
+    future: asyncio.Future[Any]
+
+
+@dataclass
+class _Reader:
+    conn: aiosqlite.Connection
+    slots: asyncio.Semaphore
+    pending: int = 0
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    size: int = 0
+
+
 class Database:
-    def __init__(self, path: str) -> None:
+    def __init__(
+        self,
+        path: str,
+        write_batch_ms: int = 20,
+        write_batch_size: int = 200,
+        reader_count: int = 2,
+        reader_queue_depth: int = 8,
+    ) -> None:
         self.path = path
         self.conn: aiosqlite.Connection | None = None
+        self.write_batch_ms = max(0, write_batch_ms)
+        self.write_batch_size = max(1, write_batch_size)
+        self.reader_count = max(0, reader_count)
+        self.reader_queue_depth = max(1, reader_queue_depth)
+        self._readers: list[_Reader] = []
+        self._write_queue: asyncio.Queue[_WriteJob | None] | None = None
+        self._writer_task: asyncio.Task[None] | None = None
+        self._settings_cache: dict[int, GuildSettings] = {}
+        self._settings_generation: dict[int, int] = {}
+        self._settings_hits = 0
+        self._settings_misses = 0
 
     async def connect(self) -> None:
         parent = os.path.dirname(self.path)
@@ -65,6 +447,7 @@ class Database:
         self.conn.row_factory = aiosqlite.Row
         await self.conn.executescript(
             """
+            PRAGMA auto_vacuum=INCREMENTAL;
             PRAGMA journal_mode=WAL;
 
             CREATE TABLE IF NOT EXISTS guild_settings (
@@ -219,26 +602,173 @@ class Database:
             """
         )
         await self.conn.commit()
+        await self._migrate()
+        await self._open_readers()
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def _migrate(self) -> None:
+        assert self.conn
+        async with self.conn.execute("PRAGMA user_version") as cur:
+            row = await cur.fetchone()
+        current = int(row[0]) if row else 0
+        for version, step in MIGRATIONS:
+            if version <= current:
+                continue
+            try:
+                if isinstance(step, str):
+                    await self.conn.executescript(f"BEGIN;\n{step}\nPRAGMA user_version = {version};\nCOMMIT;")
+                else:
+                    await self.conn.execute("BEGIN")
+                    await step(self.conn)
+                    await self.conn.execute(f"PRAGMA user_version = {version}")
+                    await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            current = version
+
+    async def _open_readers(self) -> None:
+        if self.path == ":memory:" or self.path.startswith("file:"):
+            return
+        uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+        for _ in range(self.reader_count):
+            conn = await aiosqlite.connect(uri, uri=True)
+            conn.row_factory = aiosqlite.Row
+            await conn.execute("PRAGMA query_only=ON")
+            self._readers.append(_Reader(conn=conn, slots=asyncio.Semaphore(self.reader_queue_depth)))
 
     async def close(self) -> None:
+        if self._writer_task and self._write_queue:
+            await self._write_queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+            self._write_queue = None
+        for reader in self._readers:
+            await reader.conn.close()
+        self._readers.clear()
         if self.conn:
             await self.conn.close()
 
-    async def execute(self, query: str, params: tuple[Any, ...] = ()) -> None:
+    async def _writer(self) -> None:
+        assert self._write_queue
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._write_queue.get()
+            if job is None:
+                return
+            batch = [job]
+            stopping = False
+            deadline = loop.time() + self.write_batch_ms / 1000
+            while len(batch) < self.write_batch_size:
+                if self._write_queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        job = await asyncio.wait_for(self._write_queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    job = self._write_queue.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: list[_WriteJob]) -> None:
         assert self.conn
-        await self.conn.execute(query, params)
-        await self.conn.commit()
+        results: list[tuple[_WriteJob, Any, BaseException | None]] = []
+        try:
+            if not self.conn.in_transaction:
+                await self.conn.execute("BEGIN")
+            for job in batch:
+                await self.conn.execute("SAVEPOINT write_job")
+                try:
+                    results.append((job, await job.run(self.conn), None))
+                except Exception as exc:
+                    await self.conn.execute("ROLLBACK TO write_job")
+                    results.append((job, None, exc))
+                finally:
+                    await self.conn.execute("RELEASE write_job")
+            await self.conn.commit()
+        except Exception as exc:
+            try:
+                await self.conn.rollback()
+            except Exception as rollback_exc:
+                print(f"Database rollback failed: {rollback_exc}")
+            results = [(job, None, exc) for job in batch]
+        for job, result, error in results:
+            if job.future.done():
+                continue
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def submit(self, run: WriteFn) -> asyncio.Future[Any]:
+        assert self._write_queue is not None, "Database is not connected"
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait(_WriteJob(run=run, future=future))
+        return future
+
+    def execute_nowait(self, query: str, params: tuple[Any, ...] = ()) -> asyncio.Future[None]:
+        async def run(conn: aiosqlite.Connection) -> None:
+            await conn.execute(query, params)
+
+        future = self.submit(run)
+        future.add_done_callback(_report_write_error)
+        return future
+
+    def executemany_nowait(self, query: str, params: list[tuple[Any, ...]]) -> asyncio.Future[None]:
+        async def run(conn: aiosqlite.Connection) -> None:
+            await conn.executemany(query, params)
+
+        future = self.submit(run)
+        future.add_done_callback(_report_write_error)
+        return future
+
+    async def execute(self, query: str, params: tuple[Any, ...] = ()) -> None:
+        async def run(conn: aiosqlite.Connection) -> None:
+            await conn.execute(query, params)
+
+        await self.submit(run)
+
+    async def executemany(self, query: str, params: list[tuple[Any, ...]]) -> None:
+        async def run(conn: aiosqlite.Connection) -> None:
+            await conn.executemany(query, params)
+
+        await self.submit(run)
+
+    async def _read(self, query: str, params: tuple[Any, ...], many: bool) -> Any:
+        if not self._readers:
+            assert self.conn
+            async with self.conn.execute(query, params) as cur:
+                return await cur.fetchall() if many else await cur.fetchone()
+        reader = min(self._readers, key=lambda r: r.pending)
+        reader.pending += 1
+        try:
+            async with reader.slots:
+                async with reader.conn.execute(query, params) as cur:
+                    return await cur.fetchall() if many else await cur.fetchone()
+        finally:
+            reader.pending -= 1
+
+    async def execute_returning(self, query: str, params: tuple[Any, ...] = ()) -> list[aiosqlite.Row]:
+        async def run(conn: aiosqlite.Connection) -> list[aiosqlite.Row]:
+            async with conn.execute(query, params) as cur:
+                return list(await cur.fetchall())
+
+        return await self.submit(run)
 
     async def fetchone(self, query: str, params: tuple[Any, ...] = ()) -> aiosqlite.Row | None:
-        assert self.conn
-        async with self.conn.execute(query, params) as cur:
-            return await cur.fetchone()
+        return await self._read(query, params, many=False)
 
     async def fetchall(self, query: str, params: tuple[Any, ...] = ()) -> list[aiosqlite.Row]:
-        assert self.conn
-        async with self.conn.execute(query, params) as cur:
-            rows = await cur.fetchall()
-        return rows
+        return await self._read(query, params, many=True)
 
     async def set_setting(self, guild_id: int, key: str, value: Any) -> None:
         encoded = json.dumps(value)
@@ -250,15 +780,52 @@ class Database:
             """,
             (guild_id, key, encoded),
         )
+        self._settings_generation[guild_id] = self._settings_generation.get(guild_id, 0) + 1
+        cached = self._settings_cache.get(guild_id)
+        if cached is not None:
+            self._settings_cache[guild_id] = cached.with_value(key, value)
 
-    async def get_setting(self, guild_id: int, key: str) -> Any:
-        row = await self.fetchone(
-            "SELECT value FROM guild_settings WHERE guild_id = ? AND key = ?",
-            (guild_id, key),
+    async def set_settings(self, guild_id: int, values: dict[str, Any]) -> None:
+        await self.executemany(
+            """
+            INSERT INTO guild_settings (guild_id, key, value)
+            VALUES (?, ?, ?)
+            ON CONFLICT(guild_id, key) DO UPDATE SET value=excluded.value
+            """,
+            [(guild_id, key, json.dumps(value)) for key, value in values.items()],
         )
-        if row is None:
-            return DEFAULT_GUILD_SETTINGS.get(key)
-        return json.loads(row["value"])
+        self.invalidate_settings(guild_id)
+
+    def invalidate_settings(self, guild_id: int | None = None) -> None:
+        if guild_id is None:
+            for cached_id in self._settings_cache:
+                self._settings_generation[cached_id] = self._settings_generation.get(cached_id, 0) + 1
+            self._settings_cache.clear()
+            return
+        self._settings_generation[guild_id] = self._settings_generation.get(guild_id, 0) + 1
+        self._settings_cache.pop(guild_id, None)
+
+    async def get_settings(self, guild_id: int) -> GuildSettings:
+        cached = self._settings_cache.get(guild_id)
+        if cached is not None:
+            self._settings_hits += 1
+            return cached
+        self._settings_misses += 1
+        generation = self._settings_generation.get(guild_id, 0)
+        rows = await self.fetchall("SELECT key, value FROM guild_settings WHERE guild_id = ?", (guild_id,))
+        values = dict(DEFAULT_GUILD_SETTINGS)
+        values.update({r["key"]: json.loads(r["value"]) for r in rows})
+        snapshot = GuildSettings(guild_id=guild_id, values=MappingProxyType(values))
+        if self._settings_generation.get(guild_id, 0) == generation:
+            self._settings_cache[guild_id] = snapshot
+        return snapshot
+
+    async def get_setting(self, guild_id: int, key: str) -> Any:
+        settings = await self.get_settings(guild_id)
+        return settings[key]
+
+    def settings_cache_stats(self) -> CacheStats:
+        return CacheStats(hits=self._settings_hits, misses=self._settings_misses, size=len(self._settings_cache))
 
     async def get_user_row(self, guild_id: int, user_id: int) -> aiosqlite.Row:
         await self.execute(
@@ -277,14 +844,73 @@ class Database:
         return row
 
     async def add_balance(self, guild_id: int, user_id: int, wallet_delta: int = 0, bank_delta: int = 0) -> Balance:
-        row = await self.get_user_row(guild_id, user_id)
-        new_wallet = max(0, row["wallet"] + wallet_delta)
-        new_bank = max(0, row["bank"] + bank_delta)
-        await self.execute(
-            "UPDATE user_state SET wallet = ?, bank = ? WHERE guild_id = ? AND user_id = ?",
-            (new_wallet, new_bank, guild_id, user_id),
+        rows = await self.execute_returning(
+            """
+            INSERT INTO user_state (guild_id, user_id, wallet, bank)
+            VALUES (?, ?, max(0, ?), max(0, ?))
+            ON CONFLICT(guild_id, user_id) DO UPDATE
+            SET wallet = max(0, wallet + ?), bank = max(0, bank + ?)
+            RETURNING wallet, bank
+            """,
+            (guild_id, user_id, wallet_delta, bank_delta, wallet_delta, bank_delta),
         )
-        return Balance(wallet=new_wallet, bank=new_bank)
+        return Balance(wallet=rows[0]["wallet"], bank=rows[0]["bank"])
+
+    async def try_add_balance(
+        self, guild_id: int, user_id: int, wallet_delta: int = 0, bank_delta: int = 0
+    ) -> Balance | None:
+        async def run(conn: aiosqlite.Connection) -> Balance | None:
+            await conn.execute(
+                "INSERT INTO user_state (guild_id, user_id) VALUES (?, ?) ON CONFLICT(guild_id, user_id) DO NOTHING",
+                (guild_id, user_id),
+            )
+            async with conn.execute(
+                """
+                UPDATE user_state SET wallet = wallet + ?, bank = bank + ?
+                WHERE guild_id = ? AND user_id = ? AND wallet + ? >= 0 AND bank + ? >= 0
+                RETURNING wallet, bank
+                """,
+                (wallet_delta, bank_delta, guild_id, user_id, wallet_delta, bank_delta),
+            ) as cur:
+                row = await cur.fetchone()
+            return Balance(wallet=row["wallet"], bank=row["bank"]) if row else None
+
+        return await self.submit(run)
+
+    async def transfer(self, guild_id: int, deltas: dict[int, int]) -> dict[int, Balance] | None:
+        if sum(deltas.values()) != 0:
+            raise ValueError("Transfer deltas must sum to zero")
+
+        async def run(conn: aiosqlite.Connection) -> dict[int, Balance] | None:
+            await conn.executemany(
+                "INSERT INTO user_state (guild_id, user_id) VALUES (?, ?) ON CONFLICT(guild_id, user_id) DO NOTHING",
+                [(guild_id, user_id) for user_id in deltas],
+            )
+            await conn.execute("SAVEPOINT transfer")
+            balances: dict[int, Balance] = {}
+            try:
+                for user_id, delta in sorted(deltas.items(), key=lambda item: item[1]):
+                    async with conn.execute(
+                        """
+                        UPDATE user_state SET wallet = wallet + ?
+                        WHERE guild_id = ? AND user_id = ? AND wallet + ? >= 0
+                        RETURNING wallet, bank
+                        """,
+                        (delta, guild_id, user_id, delta),
+                    ) as cur:
+                        row = await cur.fetchone()
+                    if row is None:
+                        await conn.execute("ROLLBACK TO transfer")
+                        return None
+                    balances[user_id] = Balance(wallet=row["wallet"], bank=row["bank"])
+            except Exception:
+                await conn.execute("ROLLBACK TO transfer")
+                raise
+            finally:
+                await conn.execute("RELEASE transfer")
+            return balances
+
+        return await self.submit(run)
 
     async def set_user_field(self, guild_id: int, user_id: int, field: str, value: Any) -> None:
         allowed = {
@@ -294,9 +920,6 @@ class Database:
             "reputation",
             "thanks_count",
             "birthday",
-            "notes_json",
-            "todos_json",
-            "inventory_json",
             "last_daily",
             "last_weekly",
             "last_work",
@@ -311,13 +934,89 @@ class Database:
         )
 
     async def log_event(self, guild_id: int, event_type: str, payload: dict[str, Any], actor_id: int | None = None) -> None:
-        await self.execute(
+        created_at = now_ts()
+        encoded = json.dumps(payload)
+
+        async def run(conn: aiosqlite.Connection) -> None:
+            await conn.execute(
+                """
+                INSERT INTO analytics_events (guild_id, actor_id, event_type, payload, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (guild_id, actor_id, event_type, encoded, created_at),
+            )
+            for table, width in (("analytics_hourly", 3600), ("analytics_daily", 86400)):
+                await conn.execute(
+                    f"""
+                    INSERT INTO {table} (guild_id, event_type, bucket, count) VALUES (?, ?, ?, 1)
+                    ON CONFLICT(guild_id, event_type, bucket) DO UPDATE SET count = count + 1
+                    """,
+                    (guild_id, event_type, created_at - created_at % width),
+                )
+
+        self.submit(run).add_done_callback(_report_write_error)
+
+    async def compact_analytics(
+        self,
+        retention: dict[str, int | None],
+        archive_dir: str | None = None,
+        chunk_size: int = 2000,
+        max_chunks: int = 50,
+    ) -> int:
+        default_days = retention.get("*")
+        rows = await self.fetchall("SELECT DISTINCT event_type FROM analytics_events")
+        deleted = 0
+        chunks = 0
+        for row in rows:
+            event_type = row["event_type"]
+            days = retention.get(event_type, default_days)
+            if days is None:
+                continue
+            cutoff = now_ts() - days * 86400
+            while chunks < max_chunks:
+                batch = await self.fetchall(
+                    """
+                    SELECT id, guild_id, actor_id, event_type, payload, created_at FROM analytics_events
+                    WHERE event_type = ? AND created_at < ? ORDER BY created_at, id LIMIT ?
+                    """,
+                    (event_type, cutoff, chunk_size),
+                )
+                if not batch:
+                    break
+                if archive_dir:
+                    day = datetime.now(tz=timezone.utc).strftime("%Y-%m-%d")
+                    path = os.path.join(archive_dir, f"analytics-{event_type}-{day}.ndjson.gz")
+                    await asyncio.to_thread(_append_ndjson_gz, path, [dict(r) for r in batch])
+                await self.executemany("DELETE FROM analytics_events WHERE id = ?", [(r["id"],) for r in batch])
+                deleted += len(batch)
+                chunks += 1
+                await asyncio.sleep(0.1)
+        if deleted:
+            await self.incremental_vacuum()
+        return deleted
+
+    async def prune_lyrics_cache(self, hit_ttl: int, miss_ttl: int) -> int:
+        now = now_ts()
+        rows = await self.execute_returning(
             """
-            INSERT INTO analytics_events (guild_id, actor_id, event_type, payload, created_at)
-            VALUES (?, ?, ?, ?, ?)
+            DELETE FROM lyrics_cache
+            WHERE fetched_at < ? AND (lyrics IS NULL OR lyrics = '' OR fetched_at < ?)
+            RETURNING key
             """,
-            (guild_id, actor_id, event_type, json.dumps(payload), now_ts()),
+            (now - min(hit_ttl, miss_ttl), now - hit_ttl),
         )
+        return len(rows)
+
+    async def incremental_vacuum(self, pages: int = 2000) -> None:
+        async def run(conn: aiosqlite.Connection) -> None:
+            async with conn.execute("PRAGMA auto_vacuum") as cur:
+                row = await cur.fetchone()
+            if not row or int(row[0]) != 2:
+                return
+            async with conn.execute(f"PRAGMA incremental_vacuum({int(pages)})") as cur:
+                await cur.fetchall()
+
+        await self.submit(run)
 
     async def get_bad_words(self, guild_id: int) -> set[str]:
         rows = await self.fetchall("SELECT word FROM bad_words WHERE guild_id = ?", (guild_id,))
@@ -342,27 +1041,102 @@ class Database:
             (guild_id, user_id),
         )
 
-    async def add_inventory_item(self, guild_id: int, user_id: int, item_name: str) -> list[str]:
-        row = await self.get_user_row(guild_id, user_id)
-        inventory = json.loads(row["inventory_json"])
-        inventory.append(item_name)
-        await self.set_user_field(guild_id, user_id, "inventory_json", json.dumps(inventory))
-        return inventory
+    async def add_inventory_item(self, guild_id: int, user_id: int, item_name: str, qty: int = 1) -> int:
+        rows = await self.execute_returning(
+            """
+            INSERT INTO inventory (guild_id, user_id, item, qty) VALUES (?, ?, ?, ?)
+            ON CONFLICT(guild_id, user_id, item) DO UPDATE SET qty = qty + excluded.qty
+            RETURNING qty
+            """,
+            (guild_id, user_id, item_name, qty),
+        )
+        return rows[0]["qty"]
 
-    async def get_inventory(self, guild_id: int, user_id: int) -> list[str]:
-        row = await self.get_user_row(guild_id, user_id)
-        return json.loads(row["inventory_json"])
+    async def get_inventory(self, guild_id: int, user_id: int) -> dict[str, int]:
+        rows = await self.fetchall(
+            "SELECT item, qty FROM inventory WHERE guild_id = ? AND user_id = ? AND qty > 0 ORDER BY item",
+            (guild_id, user_id),
+        )
+        return {r["item"]: r["qty"] for r in rows}
 
     async def get_notes(self, guild_id: int, user_id: int) -> list[str]:
-        row = await self.get_user_row(guild_id, user_id)
-        return json.loads(row["notes_json"])
+        rows = await self.fetchall(
+            "SELECT content FROM notes WHERE guild_id = ? AND user_id = ? ORDER BY id",
+            (guild_id, user_id),
+        )
+        return [r["content"] for r in rows]
 
-    async def set_notes(self, guild_id: int, user_id: int, notes: list[str]) -> None:
-        await self.set_user_field(guild_id, user_id, "notes_json", json.dumps(notes))
+    async def add_note(self, guild_id: int, user_id: int, content: str) -> int:
+        await self.execute(
+            "INSERT INTO notes (guild_id, user_id, content, created_at) VALUES (?, ?, ?, ?)",
+            (guild_id, user_id, content, now_ts()),
+        )
+        row = await self.fetchone("SELECT COUNT(*) AS c FROM notes WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        return row["c"] if row else 0
+
+    async def remove_note(self, guild_id: int, user_id: int, index: int) -> bool:
+        if index < 0:
+            return False
+        rows = await self.execute_returning(
+            """
+            DELETE FROM notes WHERE id = (
+                SELECT id FROM notes WHERE guild_id = ? AND user_id = ? ORDER BY id LIMIT 1 OFFSET ?
+            )
+            RETURNING id
+            """,
+            (guild_id, user_id, index),
+        )
+        return bool(rows)
 
     async def get_todos(self, guild_id: int, user_id: int) -> list[dict[str, Any]]:
-        row = await self.get_user_row(guild_id, user_id)
-        return json.loads(row["todos_json"])
+        rows = await self.fetchall(
+            "SELECT todo_id, text, done FROM todos WHERE guild_id = ? AND user_id = ? ORDER BY todo_id",
+            (guild_id, user_id),
+        )
+        return [{"id": r["todo_id"], "text": r["text"], "done": bool(r["done"])} for r in rows]
+
+    async def add_todo(self, guild_id: int, user_id: int, text: str) -> int:
+        rows = await self.execute_returning(
+            """
+            INSERT INTO todos (guild_id, user_id, todo_id, text, done)
+            SELECT ?, ?, COALESCE(MAX(todo_id), 0) + 1, ?, 0 FROM todos WHERE guild_id = ? AND user_id = ?
+            RETURNING todo_id
+            """,
+            (guild_id, user_id, text, guild_id, user_id),
+        )
+        return rows[0]["todo_id"]
 
-    async def set_todos(self, guild_id: int, user_id: int, todos: list[dict[str, Any]]) -> None:
-        await self.set_user_field(guild_id, user_id, "todos_json", json.dumps(todos))
+    async def complete_todo(self, guild_id: int, user_id: int, todo_id: int) -> bool:
+        rows = await self.execute_returning(
+            "UPDATE todos SET done = 1 WHERE guild_id = ? AND user_id = ? AND todo_id = ? RETURNING todo_id",
+            (guild_id, user_id, todo_id),
+        )
+        return bool(rows)
+
+    async def save_backup(self, guild_id: int, created_by: int, sections: Mapping[str, Any], created_at: int | None = None) -> int:
+        encoded = await asyncio.to_thread(_encode_sections, sections)
+
+        async def run(conn: aiosqlite.Connection) -> int:
+            return await _insert_backup(conn, guild_id, created_by, created_at or now_ts(), encoded)
+
+        return await self.submit(run)
+
+    async def load_backup(self, guild_id: int, backup_id: int | None = None) -> tuple[aiosqlite.Row, dict[str, Any]] | None:
+        if backup_id is None:
+            row = await self.fetchone("SELECT * FROM guild_backups WHERE guild_id = ? ORDER BY id DESC LIMIT 1", (guild_id,))
+        else:
+            row = await self.fetchone("SELECT * FROM guild_backups WHERE guild_id = ? AND id = ?", (guild_id, backup_id))
+        if not row:
+            return None
+        manifest = json.loads(row["sections"])
+        digests = list(set(manifest.values()))
+        placeholders = ",".join("?" * len(digests))
+        blobs = await self.fetchall(f"SELECT hash, data FROM backup_sections WHERE hash IN ({placeholders})", tuple(digests))
+        sections = await asyncio.to_thread(_decode_sections, manifest, {r["hash"]: r["data"] for r in blobs})
+        return row, sections
+
+    async def list_backups(self, guild_id: int, limit: int = 10) -> list[aiosqlite.Row]:
+        return await self.fetchall(
+            "SELECT id, created_by, created_at, raw_size, stored_size FROM guild_backups WHERE guild_id = ? ORDER BY id DESC LIMIT ?",
+            (guild_id, limit),
+        )
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Iterable
+
+
+class AhoCorasick:
+    def __init__(self, words: Iterable[str]) -> None:
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[str | None] = [None]
+        for word in words:
+            if word:
+                self._insert(word)
+        self._link()
+
+    def _insert(self, word: str) -> None:
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(None)
+                self.goto[node][ch] = nxt
+            node = nxt
+        self.output[node] = word
+
+    def _link(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                if self.output[nxt] is None:
+                    self.output[nxt] = self.output[self.fail[nxt]]
+
+    def __bool__(self) -> bool:
+        return len(self.goto) > 1
+
+    def search(self, text: str) -> str | None:
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node] is not None:
+                return output[node]
+        return None
+
+
+def _embeddable(pattern: str) -> bool:
+    try:
+        re.compile(f"(?P<probe>{pattern})|x")
+    except re.error:
+        return False
+    return True
+
+
+class RegexSet:
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: list[str] = []
+        self.invalid: list[str] = []
+        self.combined: re.Pattern[str] | None = None
+        self.simple: list[str] = []
+        self.separate: list[tuple[str, re.Pattern[str]]] = []
+
+        simple: list[str] = []
+        for pattern in patterns:
+            try:
+                compiled = re.compile(pattern, flags=re.IGNORECASE)
+            except re.error:
+                self.invalid.append(pattern)
+                continue
+            self.patterns.append(pattern)
+            if compiled.groups == 0 and _embeddable(pattern):
+                simple.append(pattern)
+            else:
+                self.separate.append((pattern, compiled))
+
+        if simple:
+            try:
+                self.combined = re.compile(
+                    "|".join(f"(?P<f{i}>{p})" for i, p in enumerate(simple)),
+                    flags=re.IGNORECASE,
+                )
+                self.simple = simple
+            except re.error:
+                self.separate = [(p, re.compile(p, flags=re.IGNORECASE)) for p in simple] + self.separate
+
+    def search(self, text: str) -> str | None:
+        if self.combined is not None:
+            match = self.combined.search(text)
+            if match and match.lastgroup:
+                return self.simple[int(match.lastgroup[1:])]
+        for pattern, compiled in self.separate:
+            if compiled.search(text):
+                return pattern
+        return None
+
+
+class CompiledFilter:
+    def __init__(self, words: Iterable[str], patterns: Iterable[str]) -> None:
+        self.words = AhoCorasick(sorted({w.lower() for w in words}))
+        self.regexes = RegexSet(patterns)
+
+    def match_word(self, text: str) -> str | None:
+        return self.words.search(text.lower())
+
+    def match_regex(self, text: str) -> str | None:
+        return self.regexes.search(text)
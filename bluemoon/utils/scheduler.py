@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+
+@dataclass(order=True)
+class ScheduledJob:
+    due: float
+    kind: str
+    job_id: int
+    data: dict[str, Any] = field(default_factory=dict, compare=False)
+
+    @property
+    def key(self) -> tuple[str, int]:
+        return (self.kind, self.job_id)
+
+
+LoadFn = Callable[[float], Awaitable[tuple[list[ScheduledJob], float | None]]]
+FireFn = Callable[[list[ScheduledJob]], Awaitable[None]]
+
+RELOAD_RETRY_MIN = 5.0
+RELOAD_RETRY_MAX = 300.0
+
+
+class DeadlineScheduler:
+    def __init__(self, load: LoadFn, fire: FireFn, horizon: int = 3600) -> None:
+        self.load = load
+        self.fire = fire
+        self.horizon = horizon
+        self.heap: list[ScheduledJob] = []
+        self.known: set[tuple[str, int]] = set()
+        self.loaded_until = 0.0
+        self.next_unloaded: float | None = None
+        self.retry_at: float | None = None
+        self.reload_failures = 0
+        self._wake = asyncio.Event()
+
+    def schedule(self, job: ScheduledJob) -> None:
+        if job.key in self.known:
+            return
+        self.known.add(job.key)
+        heapq.heappush(self.heap, job)
+        if self.heap[0] is job:
+            self._wake.set()
+
+    async def _reload(self) -> None:
+        until = time.time() + self.horizon
+        try:
+            jobs, next_due = await self.load(until)
+        except Exception as exc:
+            delay = min(RELOAD_RETRY_MAX, RELOAD_RETRY_MIN * 2**self.reload_failures)
+            self.reload_failures += 1
+            self.retry_at = time.time() + delay
+            print(f"Scheduler reload failed, retrying in {delay:.0f}s: {exc}")
+            return
+        self.reload_failures = 0
+        self.retry_at = None
+        for job in jobs:
+            self.schedule(job)
+        self.loaded_until = until
+        self.next_unloaded = next_due
+
+    def _reload_at(self) -> float | None:
+        if self.retry_at is not None:
+            return self.retry_at
+        return self.next_unloaded - self.horizon if self.next_unloaded is not None else None
+
+    async def run(self) -> None:
+        await self._reload()
+        while True:
+            now = time.time()
+            due: list[ScheduledJob] = []
+            while self.heap and self.heap[0].due <= now:
+                due.append(heapq.heappop(self.heap))
+            if due:
+                try:
+                    await self.fire(due)
+                except Exception as exc:
+                    print(f"Scheduler dispatch failed: {exc}")
+                finally:
+                    for job in due:
+                        self.known.discard(job.key)
+                continue
+
+            reload_at = self._reload_at()
+            if reload_at is not None and reload_at <= now:
+                await self._reload()
+                continue
+
+            wake_at = [t for t in (self.heap[0].due if self.heap else None, reload_at) if t is not None]
+            timeout = max(0.0, min(wake_at) - now) if wake_at else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import html
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import IO, Any, Awaitable, Callable
+
+import discord
+
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+CHUNK_MESSAGES = 100
+
+HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ background: #313338; color: #dbdee1; font-family: sans-serif; font-size: 14px; margin: 24px; }}
+.msg {{ padding: 4px 0; border-bottom: 1px solid #3f4147; }}
+.ts {{ color: #949ba4; font-size: 12px; }}
+.author {{ color: #f2f3f5; font-weight: bold; }}
+.content {{ white-space: pre-wrap; word-wrap: break-word; }}
+.embed {{ border-left: 4px solid #5865f2; background: #2b2d31; margin: 4px 0; padding: 6px 10px; }}
+a {{ color: #00a8fc; }}
+</style></head><body>
+<h2>#{title}</h2>
+"""
+HTML_TAIL = "<p class=\"ts\">{count} messages, exported {exported}</p>\n</body></html>\n"
+
+
+def format_text(msg: discord.Message) -> str:
+    line = f"[{msg.created_at.isoformat()}] {msg.author}: {msg.content}"
+    for attachment in msg.attachments:
+        line += f" [attachment: {attachment.url}]"
+    for embed in msg.embeds:
+        line += f" [embed: {embed.title or embed.description or embed.url or 'untitled'}]"
+    return line + "\n"
+
+
+def format_html(msg: discord.Message) -> str:
+    parts = [
+        '<div class="msg">',
+        f'<span class="ts">{msg.created_at.isoformat()}</span> ',
+        f'<span class="author">{html.escape(str(msg.author))}</span>',
+        f'<div class="content">{html.escape(msg.content)}</div>',
+    ]
+    for attachment in msg.attachments:
+        url = html.escape(attachment.url, quote=True)
+        parts.append(f'<div><a href="{url}">{html.escape(attachment.filename)}</a></div>')
+    for embed in msg.embeds:
+        parts.append('<div class="embed">')
+        if embed.title:
+            parts.append(f"<b>{html.escape(embed.title)}</b>")
+        if embed.description:
+            parts.append(f'<div class="content">{html.escape(embed.description)}</div>')
+        for embed_field in embed.fields:
+            parts.append(f"<div><b>{html.escape(str(embed_field.name))}</b>: {html.escape(str(embed_field.value))}</div>")
+        parts.append("</div>")
+    parts.append("</div>\n")
+    return "".join(parts)
+
+
+def _spool() -> IO[bytes]:
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+
+
+def _size(fp: IO[bytes]) -> int:
+    fp.seek(0, 2)
+    return fp.tell()
+
+
+def _gzip(fp: IO[bytes]) -> IO[bytes]:
+    out = _spool()
+    fp.seek(0)
+    with gzip.GzipFile(fileobj=out, mode="wb") as gz:
+        shutil.copyfileobj(fp, gz)
+    return out
+
+
+@dataclass
+class Transcript:
+    text: IO[bytes] = field(default_factory=_spool)
+    html: IO[bytes] = field(default_factory=_spool)
+    messages: int = 0
+
+    async def files(self, basename: str, limit: int) -> list[discord.File]:
+        files = []
+        for ext, fp in (("txt", self.text), ("html", self.html)):
+            name = f"{basename}.{ext}"
+            if await asyncio.to_thread(_size, fp) > limit:
+                fp = await asyncio.to_thread(_gzip, fp)
+                name += ".gz"
+                if await asyncio.to_thread(_size, fp) > limit:
+                    fp.close()
+                    continue
+            fp.seek(0)
+            files.append(discord.File(fp, filename=name))
+        return files
+
+    def close(self) -> None:
+        self.text.close()
+        self.html.close()
+
+
+async def build_transcript(channel: discord.TextChannel) -> Transcript:
+    transcript = Transcript()
+    await asyncio.to_thread(transcript.html.write, HTML_HEAD.format(title=html.escape(channel.name)).encode())
+    text_chunk: list[str] = []
+    html_chunk: list[str] = []
+
+    async def flush() -> None:
+        await asyncio.to_thread(transcript.text.write, "".join(text_chunk).encode("utf-8"))
+        await asyncio.to_thread(transcript.html.write, "".join(html_chunk).encode("utf-8"))
+        text_chunk.clear()
+        html_chunk.clear()
+
+    async for msg in channel.history(limit=None, oldest_first=True):
+        text_chunk.append(format_text(msg))
+        html_chunk.append(format_html(msg))
+        transcript.messages += 1
+        if len(text_chunk) >= CHUNK_MESSAGES:
+            await flush()
+    await flush()
+    exported = datetime.now(tz=timezone.utc).isoformat()
+    await asyncio.to_thread(transcript.html.write, HTML_TAIL.format(count=transcript.messages, exported=exported).encode())
+    return transcript
+
+
+async def send_transcript(
+    send: Callable[..., Awaitable[Any]],
+    content: str,
+    transcript: Transcript,
+    basename: str,
+    limit: int,
+) -> None:
+    files = await transcript.files(basename, limit)
+    if not files:
+        await send(f"{content}\nTranscript ({transcript.messages} messages) is too large to upload.")
+        return
+    sizes = [await asyncio.to_thread(_size, f.fp) for f in files]
+    for f in files:
+        f.fp.seek(0)
+    if sum(sizes) <= limit:
+        await send(content, files=files)
+        return
+    await send(content, file=files[0])
+    for f in files[1:]:
+        await send(file=f)
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+import queue
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import yt_dlp
+
+_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+
+def normalize_query(query: str) -> str:
+    query = query.strip()
+    if query.startswith(("http://", "https://")):
+        return query
+    return " ".join(query.lower().split())
+
+
+def stream_expiry(url: str, default_ttl: float) -> float:
+    match = _EXPIRE_RE.search(url)
+    if match:
+        return float(match.group(1))
+    return time.time() + default_ttl
+
+
+class YtdlPool:
+    def __init__(self, opts: dict[str, Any], size: int = 2) -> None:
+        self.opts = opts
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ytdl")
+        self.instances: queue.LifoQueue[yt_dlp.YoutubeDL] = queue.LifoQueue()
+        self.created = 0
+
+    def _extract(self, query: str) -> dict[str, Any] | None:
+        try:
+            ydl = self.instances.get_nowait()
+        except queue.Empty:
+            ydl = yt_dlp.YoutubeDL(self.opts)
+            self.created += 1
+        try:
+            return ydl.extract_info(query, download=False)
+        finally:
+            self.instances.put(ydl)
+
+    async def extract(self, query: str) -> dict[str, Any] | None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._extract, query)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        while not self.instances.empty():
+            self.instances.get_nowait().close()